@@ -0,0 +1,71 @@
+"""
+Changed-region detection between two RGB565 frames.
+
+Used by the panel drivers' partial update mode: instead of resending the full
+window, only the rectangles that differ from the last frame sent are
+written. Rectangles are (x0, y0, x1, y1) with exclusive ends, in the
+same coordinates SetWindows takes.
+"""
+import numpy as np
+
+# Bytes spent on SetWindows for every rectangle: 0x2A + 4, 0x2B + 4, 0x2C
+WINDOW_OVERHEAD = 11
+
+
+def _runs(indices, merge_gap, max_runs):
+    """
+    Group sorted indices into [start, end) runs.
+
+    Indices closer than merge_gap are joined into one run. When there would
+    be more than max_runs runs, only the widest gaps are kept as splits.
+    """
+    gaps = np.diff(indices) - 1
+    splits = np.flatnonzero(gaps > merge_gap)
+    if len(splits) >= max_runs:
+        widest = np.argsort(gaps[splits], kind='stable')[len(splits) - max_runs + 1:]
+        splits = np.sort(splits[widest])
+    starts = np.concatenate(([indices[0]], indices[splits + 1]))
+    ends = np.concatenate((indices[splits], [indices[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def find_dirty_rects(prev, cur, max_rects=4, merge_gap=8):
+    """
+    Find the rectangles where cur differs from prev.
+
+    Args:
+        prev: (h, w, 2) uint8 RGB565 frame that is on the panel
+        cur: (h, w, 2) uint8 RGB565 frame about to be sent
+        max_rects: upper bound on the number of rectangles returned
+        merge_gap: unchanged rows/columns narrower than this are merged
+                   into the surrounding rectangle
+
+    Returns:
+        List of (x0, y0, x1, y1); empty when the frames are identical
+    """
+    changed = prev.view(np.uint16)[..., 0] != cur.view(np.uint16)[..., 0]
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return []
+
+    rects = []
+    for y0, y1 in _runs(rows, merge_gap, max_rects):
+        band = changed[y0:y1]
+        cols = np.flatnonzero(band.any(axis=0))
+        for x0, x1 in _runs(cols, merge_gap, max_rects):
+            # Tighten the rows to what actually changed inside this column run
+            band_rows = np.flatnonzero(band[:, x0:x1].any(axis=1))
+            rects.append((x0, y0 + int(band_rows[0]), x1, y0 + int(band_rows[-1]) + 1))
+
+    if len(rects) > max_rects:
+        # Too fragmented: fall back to one rectangle per row band
+        rects = []
+        for y0, y1 in _runs(rows, merge_gap, max_rects):
+            cols = np.flatnonzero(changed[y0:y1].any(axis=0))
+            rects.append((int(cols[0]), y0, int(cols[-1]) + 1, y1))
+    return rects
+
+
+def rects_area(rects):
+    """Total number of pixels covered by the rectangles"""
+    return sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
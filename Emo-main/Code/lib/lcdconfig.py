@@ -30,57 +30,267 @@
 import os
 import sys
 import time
-import spidev
 import logging
 import numpy as np
+from . import rgb565
+
+
+class _RPiGPIOPin:
+    """RPi.GPIO pin behind the gpiozero device interface (on/off/value/close)"""
+
+    def __init__(self, GPIO, pin, output=True, pull_up=None):
+        self._GPIO = GPIO
+        self.pin = pin
+        if output:
+            GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+        else:
+            pud = GPIO.PUD_OFF if pull_up is None else (GPIO.PUD_UP if pull_up else GPIO.PUD_DOWN)
+            GPIO.setup(pin, GPIO.IN, pull_up_down=pud)
+
+    def on(self):
+        self._GPIO.output(self.pin, self._GPIO.HIGH)
+
+    def off(self):
+        self._GPIO.output(self.pin, self._GPIO.LOW)
+
+    @property
+    def value(self):
+        return self._GPIO.input(self.pin)
+
+    def close(self):
+        pass
+
+
+class _RPiGPIOPWM:
+    """RPi.GPIO software PWM behind gpiozero's PWMOutputDevice interface"""
+
+    def __init__(self, GPIO, pin, frequency):
+        GPIO.setup(pin, GPIO.OUT)
+        self._pwm = GPIO.PWM(pin, frequency)
+        self._pwm.start(0)
+        self._value = 0
+        self._frequency = frequency
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._pwm.ChangeDutyCycle(value * 100)
+
+    @property
+    def frequency(self):
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, freq):
+        self._frequency = freq
+        self._pwm.ChangeFrequency(freq)
+
+    def close(self):
+        self._pwm.stop()
+
+
+def open_spidev(bus=0, device=0):
+    """Open a real SPI device"""
+    import spidev
+    return spidev.SpiDev(bus, device)
+
+
+def _simulator():
+    from . import lcdsim
+    return lcdsim.Simulator(realtime=os.environ.get('LCD_SIM_REALTIME') == '1')
+
+
+class GPIOZeroBackend:
+    """Pins as gpiozero devices; works on every Pi model, including the Pi 5"""
+    name = 'gpiozero'
+
+    def __init__(self):
+        import gpiozero
+        self._gpiozero = gpiozero
+
+    def output(self, pin):
+        return self._gpiozero.DigitalOutputDevice(pin, active_high=True, initial_value=False)
+
+    def input(self, pin, pull_up=None, active_state=True):
+        return self._gpiozero.DigitalInputDevice(pin, pull_up=pull_up, active_state=active_state)
+
+    def pwm(self, pin, frequency):
+        return self._gpiozero.PWMOutputDevice(pin, frequency=frequency)
+
+    def spi(self, bus=0, device=0):
+        return open_spidev(bus, device)
+
+
+class RPiGPIOBackend:
+    """Pins through RPi.GPIO (BCM numbering), wrapped in gpiozero's interface"""
+    name = 'RPi.GPIO'
+
+    def __init__(self):
+        import RPi.GPIO
+        self.GPIO = RPi.GPIO
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setwarnings(False)
+
+    def output(self, pin):
+        return _RPiGPIOPin(self.GPIO, pin)
+
+    def input(self, pin, pull_up=None, active_state=True):
+        return _RPiGPIOPin(self.GPIO, pin, output=False, pull_up=pull_up)
+
+    def pwm(self, pin, frequency):
+        return _RPiGPIOPWM(self.GPIO, pin, frequency)
+
+    def spi(self, bus=0, device=0):
+        return open_spidev(bus, device)
+
+
+GPIO_BACKENDS = {
+    'gpiozero': GPIOZeroBackend,
+    'RPi.GPIO': RPiGPIOBackend,
+    'sim': _simulator,  # lcdsim.Simulator, no hardware needed
+}
+# Tried in this order by gpio_backend('auto')
+AUTO_BACKENDS = ('gpiozero', 'RPi.GPIO')
+
+
+def gpio_backend(gpio='auto'):
+    """
+    Return the GPIO backend to drive RST/DC/BL with.
+
+    Args:
+        gpio: 'auto', a key of GPIO_BACKENDS, or a backend object, which is
+              returned as is. 'auto' uses the LCD_BACKEND environment
+              variable when set, else the first GPIO library that imports.
+    """
+    if not isinstance(gpio, str):
+        return gpio
+    if gpio == 'auto':
+        gpio = os.environ.get('LCD_BACKEND', 'auto')
+    if gpio != 'auto':
+        if gpio not in GPIO_BACKENDS:
+            raise ValueError("Unknown GPIO backend {0!r}, expected one of {1}"
+                             .format(gpio, list(GPIO_BACKENDS)))
+        return GPIO_BACKENDS[gpio]()
+    for name in AUTO_BACKENDS:
+        try:
+            return GPIO_BACKENDS[name]()
+        except ImportError:
+            logging.debug("GPIO backend %s not available", name)
+    raise ImportError("No GPIO library found, install one of {0} or set LCD_BACKEND=sim"
+                      .format(list(AUTO_BACKENDS)))
+
 
 class RaspberryPi:
-    def __init__(self,spi=spidev.SpiDev(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = 18,bl_freq=1000,i2c=None,i2c_freq=100000):
-        import RPi.GPIO      
+    def __init__(self,spi=(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = 18,bl_freq=1000,i2c=None,i2c_freq=100000,gpio='auto'):
+        """
+        Args:
+            spi: SPI device object, or (bus, device) to open through the backend
+            gpio: GPIO backend name or object, see gpio_backend()
+        """
         self.np=np
-        self.RST_PIN= rst
-        self.DC_PIN = dc
-        self.BL_PIN = bl
+        self._rgb565 = {}
+        self.INPUT = False
+        self.OUTPUT = True
+
         self.SPEED  =spi_freq
         self.BL_freq=bl_freq
-        self.GPIO = RPi.GPIO
-        #self.GPIO.cleanup()
-        self.GPIO.setmode(self.GPIO.BCM)
-        self.GPIO.setwarnings(False)
-        self.GPIO.setup(self.RST_PIN,   self.GPIO.OUT)
-        self.GPIO.setup(self.DC_PIN,    self.GPIO.OUT)
-        self.GPIO.setup(self.BL_PIN,    self.GPIO.OUT)
-        self.GPIO.output(self.BL_PIN,   self.GPIO.HIGH)        
+
+        self.gpio = gpio_backend(gpio)
+        if hasattr(self.gpio, 'attach'):
+            self.gpio.attach(rst=rst, dc=dc, bl=bl)
+        self.RST_PIN= self.gpio_mode(rst,self.OUTPUT)
+        self.DC_PIN = self.gpio_mode(dc,self.OUTPUT)
+        self.BL_PIN = self.gpio_pwm(bl)
+        self.bl_DutyCycle(0)
+        
         #Initialize SPI
+        if isinstance(spi, tuple):
+            spi = self.gpio.spi(*spi)
         self.SPI = spi
         if self.SPI!=None :
             self.SPI.max_speed_hz = spi_freq
             self.SPI.mode = 0b00
 
-    def digital_write(self, pin, value):
-        self.GPIO.output(pin, value)
+    def gpio_mode(self,Pin,Mode,pull_up = None,active_state = True):
+        if Mode:
+            return self.gpio.output(Pin)
+        else:
+            return self.gpio.input(Pin,pull_up=pull_up,active_state=active_state)
 
-    def digital_read(self, pin):
-        return self.GPIO.input(pin)
+    def digital_write(self, Pin, value):
+        if value:
+            Pin.on()
+        else:
+            Pin.off()
+
+    def digital_read(self, Pin):
+        return Pin.value
 
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def gpio_pwm(self,Pin):
+        return self.gpio.pwm(Pin,self.BL_freq)
+
     def spi_writebyte(self, data):
         if self.SPI!=None :
             self.SPI.writebytes(data)
+
+    def image_to_rgb565(self, image):
+        """Convert a PIL image (or RGB array) to RGB565 in a buffer reused per size"""
+        size = rgb565.image_size(image)
+        converter = self._rgb565.get(size)
+        if converter is None:
+            converter = self._rgb565[size] = rgb565.RGB565Converter(*size)
+        return converter.convert(image)
+
+    def spi_writebyte2(self, data):
+        """Write a bytes-like buffer (bytes, memoryview, numpy array) in one call.
+
+        spidev's writebytes2 takes the buffer as is and splits it by the
+        driver's bufsiz, so no per-frame Python list is built. Older spidev
+        builds without writebytes2 fall back to chunked writebytes.
+        """
+        if self.SPI!=None :
+            if hasattr(self.SPI, 'writebytes2'):
+                self.SPI.writebytes2(data)
+            else:
+                view = memoryview(data).cast('B')
+                for i in range(0, len(view), 4096):
+                    self.SPI.writebytes(view[i:i+4096].tolist())
+
+    def send_command(self, cmd, params=None):
+        """Send a command byte, then all of its parameters as one data burst"""
+        self.digital_write(self.DC_PIN, False)
+        self.spi_writebyte([cmd])
+        if params:
+            self.digital_write(self.DC_PIN, True)
+            self.spi_writebyte2(bytes(params))
+
+    def run_init_table(self, table):
+        """
+        Execute an initialization table.
+
+        Each entry is (command, parameter bytes, delay in ms after it), so
+        the DC line changes at most twice per command instead of once per
+        parameter byte.
+        """
+        for cmd, params, delay in table:
+            self.send_command(cmd, params)
+            if delay:
+                self.delay_ms(delay)
+
     def bl_DutyCycle(self, duty):
-        self._pwm.ChangeDutyCycle(duty)
+        self.BL_PIN.value = duty / 100
         
-    def bl_Frequency(self,freq):
-        self._pwm.ChangeFrequency(freq)
+    def bl_Frequency(self,freq):# Hz
+        self.BL_PIN.frequency = freq
            
     def module_init(self):
-        self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.BL_PIN, self.GPIO.OUT)
-        self._pwm=self.GPIO.PWM(self.BL_PIN,self.BL_freq)
-        self._pwm.start(100)
         if self.SPI!=None :
             self.SPI.max_speed_hz = self.SPEED        
             self.SPI.mode = 0b00     
@@ -92,12 +302,11 @@ class RaspberryPi:
             self.SPI.close()
         
         logging.debug("gpio cleanup...")
-        self.GPIO.output(self.RST_PIN, 1)
-        self.GPIO.output(self.DC_PIN, 0)        
-        self._pwm.stop()
+        self.digital_write(self.RST_PIN, 1)
+        self.digital_write(self.DC_PIN, 0)   
+        self.BL_PIN.close()
         time.sleep(0.001)
-        self.GPIO.output(self.BL_PIN, 1)
-        #self.GPIO.cleanup()
+
 
 
 '''
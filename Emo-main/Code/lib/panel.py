@@ -0,0 +1,276 @@
+"""
+Shared driver core for the Waveshare SPI LCD panels.
+
+Every LCD_* module only describes its panel with a Panel descriptor:
+size, where the visible area sits in controller RAM, the MADCTL values
+for portrait and landscape frames, and the init table. Window setup,
+RGB565 conversion, transfer, partial update and clear all live in
+PanelDriver, so each panel takes the same path to the bus and adding a
+panel is a matter of writing its descriptor.
+
+Rotation by 180 degrees and mirroring are done by the controller through
+MADCTL (set_orientation), so frames never need to be rotated in Python.
+"""
+import logging
+
+import numpy as np
+
+from . import lcdconfig
+from . import dirtyrect
+
+MADCTL = 0x36
+# MADCTL bits: row order, column order, row/column exchange
+MADCTL_MY = 0x80
+MADCTL_MX = 0x40
+MADCTL_MV = 0x20
+
+
+class Panel:
+    """Static description of one LCD panel"""
+
+    def __init__(self, name, width, height, init_table, x_offset=0, y_offset=0,
+                 madctl=None, landscape_madctl=None, landscape_offset=None, ram_size=None):
+        """
+        Args:
+            name: Panel name, used in messages
+            width, height: Size of the frames the panel takes after Init
+            init_table: (command, parameter bytes, delay in ms) entries run by Init
+            x_offset, y_offset: Column and row where the visible area starts
+                                in controller RAM
+            madctl: MADCTL value for width x height frames, the one set by
+                    init_table by default
+            landscape_madctl: MADCTL value for height x width frames, or None
+                              when the panel only takes width x height frames
+            landscape_offset: (x, y) RAM offsets in landscape, the portrait
+                              offsets swapped by default
+            ram_size: (columns, rows) of controller RAM for width x height
+                      frames, when larger than the visible area. Needed to
+                      place the window once the panel is flipped.
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.init_table = tuple(init_table)
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        if madctl is None:
+            for cmd, params, delay in self.init_table:
+                if cmd == MADCTL and params:
+                    madctl = params[0]
+        self.madctl = madctl
+        self.landscape_madctl = landscape_madctl
+        if landscape_offset is None:
+            landscape_offset = (y_offset, x_offset)
+        self.landscape_offset = tuple(landscape_offset)
+        self.ram_size = tuple(ram_size) if ram_size is not None else None
+
+    def __repr__(self):
+        return 'Panel({0!r}, {1}x{2})'.format(self.name, self.width, self.height)
+
+
+class PanelDriver(lcdconfig.RaspberryPi):
+    """
+    Driver for a panel described by the PANEL class attribute.
+
+    Subclasses set PANEL; width, height and INIT_TABLE are taken from it.
+    """
+
+    PANEL = None
+
+    # Partial update: only resend the rectangles that changed since the last
+    # frame, unless they cover more than partial_threshold of the window.
+    partial_update = False
+    partial_threshold = 0.6
+    partial_max_rects = 4
+    _last_frame = None
+    last_update = None
+
+    # Orientation of the last frame sent, and the MADCTL value on the panel
+    _landscape = False
+    _madctl = None
+
+    # Applied by the controller on top of portrait/landscape, see set_orientation
+    rotation = 0
+    mirror = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.PANEL is not None:
+            cls.width = cls.PANEL.width
+            cls.height = cls.PANEL.height
+            cls.INIT_TABLE = cls.PANEL.init_table
+
+    def command(self, cmd):
+        self.send_command(cmd)
+
+    def data(self, val):
+        self.digital_write(self.DC_PIN, True)
+        self.spi_writebyte([val])
+
+    def reset(self):
+        """Reset the display"""
+        self.digital_write(self.RST_PIN, True)
+        self.delay_ms(10)
+        self.digital_write(self.RST_PIN, False)
+        self.delay_ms(10)
+        self.digital_write(self.RST_PIN, True)
+        self.delay_ms(10)
+
+    def Init(self):
+        """Initialize dispaly"""
+        self.module_init()
+        self.reset()
+        self.run_init_table(self.INIT_TABLE)
+        self._landscape = False
+        self._madctl = self.PANEL.madctl
+        self._last_frame = None
+
+    def set_orientation(self, rotation=0, mirror=False):
+        """
+        Have the controller rotate and mirror frames.
+
+        Takes effect from the next frame or clear, and replaces rotating
+        every frame in Python. Portrait or landscape is still picked from
+        each frame's shape.
+
+        Args:
+            rotation: 0 or 180 degrees
+            mirror: Mirror frames left to right
+        """
+        if rotation not in (0, 180):
+            raise ValueError("rotation must be 0 or 180, got {0!r}".format(rotation))
+        if (rotation or mirror) and self.PANEL.madctl is None:
+            raise ValueError("{0} has no MADCTL value to rotate with".format(self.PANEL.name))
+        self.rotation = rotation
+        self.mirror = bool(mirror)
+
+    def _flips(self):
+        """Whether frames are flipped along x and y on screen"""
+        flip = self.rotation == 180
+        return flip != self.mirror, flip
+
+    def orientation_madctl(self, landscape):
+        """MADCTL value for portrait or landscape frames with the current orientation"""
+        madctl = self.PANEL.landscape_madctl if landscape else self.PANEL.madctl
+        if madctl is None:
+            return None
+        flip_x, flip_y = self._flips()
+        # With rows and columns exchanged, screen x runs along controller rows
+        x_bit, y_bit = (MADCTL_MY, MADCTL_MX) if madctl & MADCTL_MV else (MADCTL_MX, MADCTL_MY)
+        if flip_x:
+            madctl ^= x_bit
+        if flip_y:
+            madctl ^= y_bit
+        return madctl
+
+    def apply_orientation(self, landscape):
+        """Switch the panel to portrait or landscape; MADCTL is only written when it changes"""
+        madctl = self.orientation_madctl(landscape)
+        if madctl is not None and madctl != self._madctl:
+            self.send_command(MADCTL, [madctl])
+            self._madctl = madctl
+            self._last_frame = None
+        self._landscape = landscape
+
+    def frame_size(self):
+        """(width, height) of the frames the panel currently takes"""
+        if self._landscape:
+            return self.height, self.width
+        return self.width, self.height
+
+    def window_offset(self):
+        """(x, y) RAM offset of the visible area in the current orientation"""
+        panel = self.PANEL
+        if self._landscape:
+            x_offset, y_offset = panel.landscape_offset
+        else:
+            x_offset, y_offset = panel.x_offset, panel.y_offset
+        if panel.ram_size is not None:
+            flip_x, flip_y = self._flips()
+            ram_cols, ram_rows = panel.ram_size[::-1] if self._landscape else panel.ram_size
+            cols, rows = self.frame_size()
+            if flip_x:
+                x_offset = ram_cols - cols - x_offset
+            if flip_y:
+                y_offset = ram_rows - rows - y_offset
+        return x_offset, y_offset
+
+    def SetWindows(self, Xstart, Ystart, Xend, Yend):
+        x_offset, y_offset = self.window_offset()
+        Xstart += x_offset
+        Xend += x_offset - 1
+        Ystart += y_offset
+        Yend += y_offset - 1
+        #set the X coordinates
+        self.send_command(0x2A, [Xstart >> 8, Xstart & 0xff, Xend >> 8, Xend & 0xff])
+
+        #set the Y coordinates
+        self.send_command(0x2B, [Ystart >> 8, Ystart & 0xff, Yend >> 8, Yend & 0xff])
+
+        self.send_command(0x2C)
+
+    def ShowImage(self, Image, Xstart=0, Ystart=0):
+        """Set buffer to value of Python Imaging Library image."""
+        """Write display buffer to physical display"""
+        self.ShowBuffer(self.image_to_rgb565(Image))
+
+    def ShowBuffer(self, pix):
+        """
+        Write an (h, w, 2) RGB565 frame.
+
+        width x height frames are sent in portrait, height x width frames
+        in landscape on panels that have a landscape MADCTL value, both in
+        the orientation set with set_orientation.
+        """
+        rows, cols = pix.shape[:2]
+        if cols == self.width and rows == self.height:
+            landscape = False
+        elif cols == self.height and rows == self.width and self.PANEL.landscape_madctl is not None:
+            landscape = True
+        else:
+            raise ValueError('Image must be same dimensions as display \
+                ({0}x{1}).' .format(self.width, self.height))
+        self.apply_orientation(landscape)
+        self.write_frame(pix)
+
+    def write_frame(self, pix):
+        """
+        Send an (h, w, 2) RGB565 frame to a window at the panel origin.
+
+        With partial_update on, only the rectangles that differ from the
+        previous frame are sent. Bytes sent and saved are kept in
+        last_update.
+        """
+        rows, cols = pix.shape[:2]
+        full_bytes = pix.nbytes + dirtyrect.WINDOW_OVERHEAD
+        rects = None
+        if self.partial_update and self._last_frame is not None and self._last_frame.shape == pix.shape:
+            rects = dirtyrect.find_dirty_rects(self._last_frame, pix, self.partial_max_rects)
+            if dirtyrect.rects_area(rects) > self.partial_threshold * rows * cols:
+                rects = None
+        if rects is None:
+            rects = [(0, 0, cols, rows)]
+
+        for x0, y0, x1, y1 in rects:
+            self.SetWindows(x0, y0, x1, y1)
+            self.digital_write(self.DC_PIN, True)
+            self.spi_writebyte2(np.ascontiguousarray(pix[y0:y1, x0:x1]))
+
+        if self.partial_update:
+            if self._last_frame is None or self._last_frame.shape != pix.shape:
+                self._last_frame = pix.copy()
+            else:
+                np.copyto(self._last_frame, pix)
+        sent = dirtyrect.rects_area(rects) * 2 + len(rects) * dirtyrect.WINDOW_OVERHEAD
+        self.last_update = {'rects': len(rects), 'bytes_sent': sent, 'bytes_saved': full_bytes - sent}
+        logging.debug("LCD update: %d rects, %d bytes sent, %d saved", len(rects), sent, full_bytes - sent)
+
+    def clear(self, color=0xFFFF):
+        """Fill the panel with one RGB565 color, white by default"""
+        self.apply_orientation(self._landscape)
+        cols, rows = self.frame_size()
+        _buffer = bytes([(color >> 8) & 0xff, color & 0xff]) * (cols * rows)
+        self._last_frame = None
+        self.SetWindows(0, 0, cols, rows)
+        self.digital_write(self.DC_PIN, True)
+        self.spi_writebyte2(_buffer)
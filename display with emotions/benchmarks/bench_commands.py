@@ -0,0 +1,89 @@
+"""
+Round-trip latency and throughput of the command server.
+
+Starts a CommandServer whose commands go to a queue, as the player's do,
+and measures from a client: the time from sending one command to reading
+its ack, and commands per second when they are sent in batches, as lines
+and length-prefixed, over a UNIX socket and localhost TCP. Run from the
+"display with emotions" directory:
+
+    python benchmarks/bench_commands.py [-n 2000] [--batch 50]
+"""
+import os
+import sys
+import time
+import queue
+import socket
+import tempfile
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from command_server import CommandServer, parse_address
+
+
+def connect(address):
+    family, address = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(address)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock, sock.makefile('rb')
+
+
+def encode(command, framed):
+    body = command.encode()
+    return len(body).to_bytes(4, 'big') + body if framed else body + b'\n'
+
+
+def read_ack(reader, framed):
+    if framed:
+        return reader.read(int.from_bytes(reader.read(4), 'big'))
+    return reader.readline()
+
+
+def run(name, address, commands, count, batch, framed):
+    sock, reader = connect(address)
+    # One command at a time: latency of the ack
+    latencies = []
+    for _ in range(min(count, 500)):
+        start = time.perf_counter()
+        sock.sendall(encode('blink', framed))
+        read_ack(reader, framed)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    # Batches: throughput
+    data = encode('blink', framed) * batch
+    start = time.perf_counter()
+    for _ in range(count // batch):
+        sock.sendall(data)
+        for _ in range(batch):
+            read_ack(reader, framed)
+    rate = (count // batch) * batch / (time.perf_counter() - start)
+    sock.close()
+    while not commands.empty():
+        commands.get_nowait()
+    print(f"{name:18s} ack p50 {latencies[len(latencies) // 2] * 1e6:7.0f} us "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.0f} us "
+          f"{rate:9.0f} commands/s in batches of {batch}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', type=int, default=2000, help="commands per run")
+    parser.add_argument('--batch', type=int, default=50, help="commands per write")
+    args = parser.parse_args()
+
+    commands = queue.Queue()
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sock')
+    for kind, address in (('unix', path), ('tcp', '0')):
+        server = CommandServer(commands.put, address)
+        server.start()
+        if kind == 'tcp':
+            address = f"{server.address[0]}:{server.address[1]}"
+        for framed in (False, True):
+            run(f"{kind} {'framed' if framed else 'lines'}", address, commands, args.n, args.batch, framed)
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
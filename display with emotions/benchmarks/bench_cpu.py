@@ -0,0 +1,67 @@
+"""
+CPU used by the player while idle and while playing.
+
+Runs RobotEmotionsLCD from new.py on the LCD simulator in real time
+(LCD_BACKEND=sim, LCD_SIM_REALTIME=1), feeds it commands directly instead
+of reading stdin, and reports process CPU time over wall time for:
+
+    idle       waiting for the boot command
+    playing    bootup, then the neutral loop
+    sleeping   the sleep loop
+
+100% is one core fully busy. Run from the "display with emotions" directory:
+
+    python benchmarks/bench_cpu.py [--seconds 5]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(BASE_DIR)
+
+
+def cpu_percent(seconds):
+    """Process CPU time over wall time, in percent of one core"""
+    cpu, wall = time.process_time(), time.monotonic()
+    time.sleep(seconds)
+    return (time.process_time() - cpu) / (time.monotonic() - wall) * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5, help="length of each measurement")
+    parser.add_argument("--settle", type=float, default=1, help="seconds to wait after each command")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LCD_BACKEND", "sim")
+    os.environ.setdefault("LCD_SIM_REALTIME", "1")
+    os.chdir(BASE_DIR)
+    import new
+
+    robot = new.RobotEmotionsLCD()
+    robot.command_listener = lambda: None  # commands come from here, not stdin
+    player = threading.Thread(target=robot.run, name="player")
+    player.daemon = True
+    player.start()
+
+    results = {}
+    time.sleep(args.settle)
+    results['idle'] = cpu_percent(args.seconds)
+    robot.post_command('boot')
+    time.sleep(args.settle)
+    results['playing'] = cpu_percent(args.seconds)
+    robot.post_command('sleep')
+    time.sleep(args.settle)
+    results['sleeping'] = cpu_percent(args.seconds)
+    robot.shutdown()  # any command would only wake it from sleep
+    player.join(10)
+
+    for state, percent in results.items():
+        print(f"{state:9s} {percent:6.1f}% CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare delta packs with the PNG frames and raw frame packs they replace.
+
+For each emotion, reports the size of the PNG directory, of a raw frame
+pack (framepack.py) and of a delta pack (deltapack.py), and the mean time
+to get a panel-ready RGB565 frame from PNG (decode + convert) and from the
+delta pack (sequential playback, one delta per frame). Every decoded
+frame is checked against the converted PNG. Run from the
+"display with emotions" directory:
+
+    python benchmarks/bench_deltapack.py [emotion ...] [--keyframe-interval 30]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(BASE_DIR)
+from lib import rgb565
+from framepack import emotion_frame_paths
+from deltapack import DeltaPack, compile_delta_pack
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("emotions", nargs="*", default=["neutral", "sleep", "angry", "dizzy"])
+    parser.add_argument("--keyframe-interval", type=int, default=30)
+    parser.add_argument("--tile", type=int, default=16)
+    args = parser.parse_args()
+
+    converter = rgb565.RGB565Converter(320, 240)
+    print(f"{'emotion':9s} {'frames':>6s} {'png MB':>7s} {'raw MB':>7s} {'delta MB':>8s} "
+          f"{'png us':>7s} {'delta us':>8s} {'match':>5s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for emotion in args.emotions:
+            paths = emotion_frame_paths(BASE_DIR, emotion)
+            if not paths:
+                print(f"{emotion:9s} no frames")
+                continue
+            pack_file = os.path.join(tmp, emotion + ".dpk")
+            compile_delta_pack(paths, pack_file, 20, args.keyframe_interval, args.tile, emotion)
+
+            start = time.perf_counter()
+            expected = [converter.convert(Image.open(path)).copy() for path in paths]
+            png = (time.perf_counter() - start) / len(paths)
+
+            with DeltaPack(pack_file) as pack:
+                start = time.perf_counter()
+                for i in range(len(pack)):
+                    pack.frame(i)
+                delta = (time.perf_counter() - start) / len(pack)
+                match = all(np.array_equal(pack.frame(i), expected[i]) for i in range(len(pack)))
+                # Random access goes back to a keyframe
+                for i in np.random.default_rng(0).integers(0, len(pack), 20):
+                    match = match and np.array_equal(pack[i], expected[i])
+                raw_bytes, delta_bytes = pack.raw_nbytes(), os.path.getsize(pack_file)
+
+            png_bytes = sum(os.path.getsize(path) for path in paths)
+            print(f"{emotion:9s} {len(paths):6d} {png_bytes / 1e6:7.1f} {raw_bytes / 1e6:7.1f} "
+                  f"{delta_bytes / 1e6:8.1f} {png * 1e6:7.0f} {delta * 1e6:8.0f} {'yes' if match else 'NO':>5s}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare preparing frames from PNG files with reading them from a frame pack.
+
+For each emotion, the PNG path does what new.py did per frame (open,
+decode, rotate 180, convert to RGB565); the pack path takes the frame
+from a memory-mapped pack and copies it once, as spidev would. Peak
+Python allocations per frame are measured with tracemalloc.
+Run from the "display with emotions" directory:
+
+    python benchmarks/bench_framepack.py [emotion ...] [-n 20]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from PIL import Image
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(BASE_DIR)
+from lib import rgb565
+from framepack import FramePack, compile_pack, emotion_frame_paths
+
+
+def per_frame(fn, frames):
+    """Mean seconds and peak traced bytes of fn over frames"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in frames:
+        fn(frame)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed / len(frames), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("emotions", nargs="*", default=["happy", "neutral", "dizzy"])
+    parser.add_argument("-n", "--frames", type=int, default=20, help="frames per emotion")
+    args = parser.parse_args()
+
+    converter = rgb565.RGB565Converter(320, 240)
+    png_path = lambda path: converter.convert(Image.open(path).rotate(180))
+    pack_frame = lambda frame: frame.tobytes()
+
+    print(f"{'emotion':10s} {'png us':>9s} {'pack us':>9s} {'png peak KB':>12s} {'pack peak KB':>13s} {'speedup':>8s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for emotion in args.emotions:
+            paths = emotion_frame_paths(BASE_DIR, emotion)[:args.frames]
+            if not paths:
+                print(f"{emotion:10s} no frames")
+                continue
+            pack_file = os.path.join(tmp, emotion + ".fpk")
+            compile_pack(paths, pack_file, 20, 180, emotion)
+            with FramePack(pack_file) as pack:
+                png, png_peak = per_frame(png_path, paths)
+                packed, pack_peak = per_frame(pack_frame, pack)
+            print(f"{emotion:10s} {png * 1e6:9.0f} {packed * 1e6:9.0f} {png_peak / 1024:12.0f} "
+                  f"{pack_peak / 1024:13.0f} {png / packed:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare per-byte panel initialization with the table-driven executor.
+
+Legacy: one command()/data() call per byte, as the drivers used to do,
+so the DC line toggles and one SPI transfer happens for every byte.
+Table: RaspberryPi.run_init_table, one burst per command.
+
+Runs LCD_2inch.INIT_TABLE against recording stand-ins and reports SPI
+calls, DC pin writes and Python time. The estimate column adds a
+per-operation cost for real hardware (gpiozero pin writes and spidev
+ioctls are each tens of microseconds on a Pi); tune it with --gpio-us
+and --spi-us. Run from the "display with emotions" directory:
+
+    python benchmarks/bench_init.py [-n 200]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import LCD_2inch
+from standins import RecordingSpi, RecordingPin
+
+
+def make_display():
+    disp = LCD_2inch.LCD_2inch.__new__(LCD_2inch.LCD_2inch)
+    disp.np = np
+    disp.SPI = RecordingSpi()
+    disp.DC_PIN = RecordingPin()
+    disp.delay_ms = lambda delaytime: None
+    return disp
+
+
+def legacy_init(disp, table):
+    for cmd, params, delay in table:
+        disp.command(cmd)
+        for value in params:
+            disp.data(value)
+        if delay:
+            disp.delay_ms(delay)
+
+
+def table_init(disp, table):
+    disp.run_init_table(table)
+
+
+def run(name, init, table, repeat, gpio_us, spi_us):
+    disp = make_display()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        init(disp, table)
+    elapsed = (time.perf_counter() - start) / repeat
+    calls = disp.SPI.calls // repeat
+    writes = disp.DC_PIN.writes // repeat
+    estimate = elapsed + (calls * spi_us + writes * gpio_us) / 1e6
+    print(f"{name:7s} {calls:6d} spi calls {writes:6d} DC writes "
+          f"{elapsed * 1e3:8.3f} ms python {estimate * 1e3:8.2f} ms estimated on hardware")
+    return estimate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeat", type=int, default=200)
+    parser.add_argument("--gpio-us", type=float, default=20.0, help="cost of one DC pin write")
+    parser.add_argument("--spi-us", type=float, default=15.0, help="cost of one SPI transfer")
+    args = parser.parse_args()
+
+    table = LCD_2inch.LCD_2inch.INIT_TABLE
+    delays = sum(delay for _, _, delay in table)
+    print(f"LCD_2inch: {len(table)} commands, {sum(len(p) for _, p, _ in table)} parameter bytes, "
+          f"{delays} ms of fixed delays (not included below)")
+    old = run("legacy", legacy_init, table, args.repeat, args.gpio_us, args.spi_us)
+    new = run("table", table_init, table, args.repeat, args.gpio_us, args.spi_us)
+    print(f"saved   {(old - new) * 1e3:.2f} ms per Init")
+
+
+if __name__ == "__main__":
+    main()
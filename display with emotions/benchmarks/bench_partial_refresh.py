@@ -0,0 +1,83 @@
+"""
+Report the bytes partial refresh saves on the real emotion animations.
+
+Each emotion is played through LCD_2inch.ShowImage twice, against a
+recording bus: once with full refreshes and once with partial_update on.
+Frames are sent as drawn, like new.py does (the panel rotates them).
+Run from the "display with emotions" directory:
+
+    python benchmarks/bench_partial_refresh.py [emotion ...] [-v] [--threshold 0.6]
+"""
+import os
+import re
+import sys
+import glob
+import argparse
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(BASE_DIR)
+from lib import LCD_2inch
+from standins import RecordingSpi, RecordingPin
+
+EMOTIONS = ['bootup', 'bootup3', 'neutral', 'angry', 'blink', 'blink2', 'dizzy',
+            'excited', 'happy', 'happy2', 'happy3', 'sad', 'sleep']
+
+
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower()
+            for text in re.split('([0-9]+)', s)]
+
+
+def make_display(partial, threshold):
+    disp = LCD_2inch.LCD_2inch.__new__(LCD_2inch.LCD_2inch)
+    disp.np = np
+    disp._rgb565 = {}
+    disp.SPI = RecordingSpi()
+    disp.DC_PIN = RecordingPin()
+    disp.partial_update = partial
+    disp.partial_threshold = threshold
+    return disp
+
+
+def play(disp, frames, label=None):
+    """Show every frame, returning the bytes each one put on the bus"""
+    sent = []
+    for i, path in enumerate(frames):
+        disp.SPI.reset()
+        disp.ShowImage(Image.open(path))
+        sent.append(disp.SPI.bytes_written)
+        if label:
+            print(f"  {label}[{i}] rects={disp.last_update['rects']} sent={sent[-1]}")
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("emotions", nargs="*", default=EMOTIONS)
+    parser.add_argument("--threshold", type=float, default=LCD_2inch.LCD_2inch.partial_threshold)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every frame")
+    args = parser.parse_args()
+
+    total_full = total_partial = 0
+    print(f"{'emotion':10s} {'frames':>6s} {'full KB':>9s} {'partial KB':>10s} {'saved':>6s} {'min/frame':>9s} {'max/frame':>9s}")
+    for emotion in args.emotions:
+        frames = sorted(glob.glob(os.path.join(BASE_DIR, emotion, "frame*.png")), key=natural_sort_key)
+        if not frames:
+            continue
+        full = play(make_display(False, args.threshold), frames)
+        partial = play(make_display(True, args.threshold), frames, emotion if args.verbose else None)
+        saved = [f - p for f, p in zip(full, partial)]
+        total_full += sum(full)
+        total_partial += sum(partial)
+        print(f"{emotion:10s} {len(frames):6d} {sum(full) / 1024:9.0f} {sum(partial) / 1024:10.0f} "
+              f"{100.0 * sum(saved) / sum(full):5.1f}% {min(saved):9d} {max(saved):9d}")
+    if total_full:
+        print(f"{'total':10s} {'':6s} {total_full / 1024:9.0f} {total_partial / 1024:10.0f} "
+              f"{100.0 * (total_full - total_partial) / total_full:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark of the frame pipeline, stage by stage, per emotion.
+
+Every frame of every emotion goes through the stages of the
+RobotEmotionsLCD path:
+
+    decode       Image.open + load of the PNG
+    rotate       image.rotate(180), what the panel now does through MADCTL
+    convert      RGB888 -> RGB565 into a reused buffer
+    pack_list    flatten().tolist(), the legacy per-frame list packing
+    transfer     LCD_2inch.ShowBuffer, Python side, on a recording bus
+    bus          modelled bus time of the frame at --spi-freq (lib/lcdsim.py)
+    schedule     overshoot of the time.sleep() that paces playback
+
+Reports mean microseconds per stage, peak Python memory while a frame is
+prepared, and the frame rate the pipeline can reach from PNGs (decode and
+convert overlap with the transfer in the display writer) and from frame
+packs, against each emotion's emotion_speeds target.
+
+Run from the "display with emotions" directory:
+
+    python benchmarks/bench_pipeline.py [emotion ...] [--json out.json]
+    python benchmarks/bench_pipeline.py --baseline out.json    # exit 1 on regressions
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+
+import numpy as np
+import PIL
+from PIL import Image
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(BASE_DIR)
+from lib import LCD_2inch, lcdsim, rgb565
+from framepack import emotion_frame_paths
+from emotions import EMOTION_SPEEDS
+from standins import RecordingSpi
+
+STAGES = ['decode', 'rotate', 'convert', 'pack_list', 'transfer', 'bus', 'schedule']
+# Sleep overshoot depends on the machine's load more than on our code
+CHECKED_STAGES = [stage for stage in STAGES if stage != 'schedule']
+
+
+def make_display(spi, sim, spi_freq):
+    disp = LCD_2inch.LCD_2inch(spi=spi, spi_freq=spi_freq, gpio=sim)
+    disp.Init()
+    return disp
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def peak_memory(paths, converter):
+    """Peak traced bytes while decoding and converting the given frames"""
+    tracemalloc.start()
+    for path in paths:
+        image = Image.open(path)
+        image.load()
+        converter.convert(image)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def schedule_overshoot(fps, samples):
+    """Mean time.sleep() overshoot at the emotion's frame delay"""
+    delay = 1.0 / fps
+    total = 0.0
+    for _ in range(samples):
+        start = time.perf_counter()
+        time.sleep(delay)
+        total += time.perf_counter() - start - delay
+    return total / samples
+
+
+def bench_emotion(emotion, paths, args):
+    converter = rgb565.RGB565Converter(320, 240)
+    sim = lcdsim.Simulator()
+    null_disp = make_display(RecordingSpi(), lcdsim.Simulator(), args.spi_freq)
+    sim_disp = make_display((0, 0), sim, args.spi_freq)
+
+    totals = dict.fromkeys(STAGES, 0.0)
+    for path in paths:
+        image = Image.open(path)
+        _, t = timed(image.load)
+        totals['decode'] += t
+        _, t = timed(image.rotate, 180)
+        totals['rotate'] += t
+        pix, t = timed(converter.convert, image)
+        totals['convert'] += t
+        _, t = timed(lambda: pix.flatten().tolist())
+        totals['pack_list'] += t
+        _, t = timed(null_disp.ShowBuffer, pix)
+        totals['transfer'] += t
+        before = sim.bus_time
+        sim_disp.ShowBuffer(pix)
+        totals['bus'] += sim.bus_time - before
+
+    result = {stage: totals[stage] / len(paths) * 1e6 for stage in STAGES if stage != 'schedule'}
+    result['schedule'] = schedule_overshoot(EMOTION_SPEEDS[emotion], args.schedule_samples) * 1e6
+    result = {stage: round(result[stage], 1) for stage in STAGES}
+
+    # The display writer overlaps preparing a frame with sending the previous one
+    send = result['transfer'] + result['bus']
+    prepare = result['decode'] + result['convert']
+    target = EMOTION_SPEEDS[emotion]
+    result.update({
+        'frames': len(paths),
+        'target_fps': target,
+        'fps_png': round(1e6 / (max(prepare, send) + result['schedule']), 1),
+        'fps_pack': round(1e6 / (send + result['schedule']), 1),
+        'peak_kb': round(peak_memory(paths[:args.memory_frames], converter) / 1024, 1),
+    })
+    result['meets_target'] = result['fps_png'] >= target
+    return result
+
+
+def check_regressions(results, baseline, tolerance, min_us):
+    """Stages slower than the baseline by more than tolerance and min_us, and lost fps targets"""
+    failures = []
+    for emotion, stages in results['emotions'].items():
+        old = baseline.get('emotions', {}).get(emotion)
+        if not old:
+            continue
+        if old.get('meets_target') and not stages['meets_target']:
+            failures.append(f"{emotion} no longer reaches {stages['target_fps']} fps")
+        for stage in CHECKED_STAGES:
+            if stage in old and stages[stage] > old[stage] * (1 + tolerance) and stages[stage] - old[stage] > min_us:
+                failures.append(f"{emotion} {stage}: {old[stage]:.1f} -> {stages[stage]:.1f} us")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("emotions", nargs="*", default=list(EMOTION_SPEEDS))
+    parser.add_argument("-n", "--frames", type=int, help="frames per emotion (default: all)")
+    parser.add_argument("--spi-freq", type=int, default=40000000, help="SPI clock for the bus model")
+    parser.add_argument("--schedule-samples", type=int, default=10)
+    parser.add_argument("--memory-frames", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown per stage (default: 25%%)")
+    parser.add_argument("--min-us", type=float, default=100, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'numpy': np.__version__,
+            'pillow': PIL.__version__,
+            'spi_freq': args.spi_freq,
+        },
+        'emotions': {},
+    }
+    print(f"{'emotion':9s} {'frames':>6s} " + " ".join(f"{s:>9s}" for s in STAGES)
+          + f" {'peak KB':>8s} {'target':>6s} {'fps png':>8s} {'fps pack':>8s}")
+    for emotion in args.emotions:
+        paths = emotion_frame_paths(BASE_DIR, emotion)[:args.frames]
+        if not paths:
+            print(f"{emotion:9s} no frames")
+            continue
+        r = results['emotions'][emotion] = bench_emotion(emotion, paths, args)
+        print(f"{emotion:9s} {r['frames']:6d} " + " ".join(f"{r[s]:9.1f}" for s in STAGES)
+              + f" {r['peak_kb']:8.0f} {r['target_fps']:6d} {r['fps_png']:8.1f} {r['fps_pack']:8.1f}"
+              + ("" if r['meets_target'] else "  below target"))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = check_regressions(results, json.load(f), args.tolerance, args.min_us)
+        for failure in failures:
+            print("REGRESSION", failure)
+        if failures:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of RGB888 -> RGB565 conversion for every panel size.
+
+Compares the fancy-indexed conversion the drivers used to inline with
+lib/rgb565.py (single frames into a reused buffer, and batches).
+Run from the "display with emotions" directory:
+
+    python benchmarks/bench_rgb565.py [-n 200] [--batch 32]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import rgb565
+
+# (name, width, height) as declared by the LCD_* drivers
+PANELS = [
+    ("LCD_0inch96", 160, 80),
+    ("LCD_1inch14", 240, 135),
+    ("LCD_1inch28", 240, 240),
+    ("LCD_1inch3", 240, 240),
+    ("LCD_1inch47", 172, 320),
+    ("LCD_1inch54", 240, 240),
+    ("LCD_1inch8", 160, 128),
+    ("LCD_2inch", 320, 240),
+    ("LCD_2inch4", 320, 240),
+]
+
+
+def legacy(img):
+    """The conversion previously copy-pasted into each ShowImage"""
+    pix = np.zeros((img.shape[0], img.shape[1], 2), dtype=np.uint8)
+    pix[...,[0]] = np.add(np.bitwise_and(img[...,[0]],0xF8),np.right_shift(img[...,[1]],5))
+    pix[...,[1]] = np.add(np.bitwise_and(np.left_shift(img[...,[1]],3),0xE0), np.right_shift(img[...,[2]],3))
+    return pix
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeat", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'panel':12s} {'size':>8s} {'legacy us':>10s} {'shared us':>10s} {'batch us':>10s} {'speedup':>8s}")
+    for name, width, height in PANELS:
+        frames = rng.integers(0, 256, (args.batch, height, width, 3), dtype=np.uint8)
+        frame = frames[0]
+        converter = rgb565.RGB565Converter(width, height)
+        batch_out = converter.new_buffer(args.batch)
+        assert (converter.convert(frame) == legacy(frame)).all()
+
+        old = timed(lambda: legacy(frame), args.repeat)
+        new = timed(lambda: converter.convert(frame), args.repeat)
+        batch = timed(lambda: converter.convert_batch(frames, batch_out), max(1, args.repeat // args.batch)) / args.batch
+        print(f"{name:12s} {width:>4d}x{height:<4d} {old * 1e6:10.1f} {new * 1e6:10.1f} {batch * 1e6:10.1f} {old / new:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
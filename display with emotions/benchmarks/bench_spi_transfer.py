@@ -0,0 +1,86 @@
+"""
+Compare the old list-based frame transfer with the buffer path.
+
+Old path: pix.flatten().tolist() and 4096-element slices to writebytes.
+New path: the RGB565 numpy buffer handed straight to spi_writebyte2.
+
+Both run against RecordingSpi, so only the Python-side cost is measured.
+Run from the "display with emotions" directory:
+
+    python benchmarks/bench_spi_transfer.py [frame.png] [-n 200]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib import LCD_2inch
+from standins import RecordingSpi
+
+DEFAULT_FRAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "neutral", "frame0.png")
+
+
+def make_display(spi):
+    """Create a driver instance without opening GPIO, wired to the stand-in bus"""
+    disp = LCD_2inch.LCD_2inch.__new__(LCD_2inch.LCD_2inch)
+    disp.np = np
+    disp.SPI = spi
+    return disp
+
+
+def load_pix(path):
+    """Convert a frame to the (h, w, 2) RGB565 array ShowImage builds"""
+    if path and os.path.exists(path):
+        img = np.asarray(Image.open(path).convert("RGB"))
+    else:
+        img = np.random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    pix = np.zeros((img.shape[0], img.shape[1], 2), dtype=np.uint8)
+    pix[...,[0]] = np.add(np.bitwise_and(img[...,[0]],0xF8),np.right_shift(img[...,[1]],5))
+    pix[...,[1]] = np.add(np.bitwise_and(np.left_shift(img[...,[1]],3),0xE0), np.right_shift(img[...,[2]],3))
+    return pix
+
+
+def send_list(disp, pix):
+    data = pix.flatten().tolist()
+    for i in range(0, len(data), 4096):
+        disp.spi_writebyte(data[i:i+4096])
+
+
+def send_buffer(disp, pix):
+    disp.spi_writebyte2(pix)
+
+
+def run(name, send, disp, pix, frames):
+    disp.SPI.reset()
+    start = time.perf_counter()
+    for _ in range(frames):
+        send(disp, pix)
+    elapsed = time.perf_counter() - start
+    spi = disp.SPI
+    per_frame = elapsed / frames
+    print(f"{name:8s} {per_frame * 1e3:8.3f} ms/frame  {1.0 / per_frame:8.1f} fps  "
+          f"{spi.bytes_written / elapsed / 1e6:8.1f} MB/s  "
+          f"{spi.calls // frames} calls, {spi.transfers // frames} transfers per frame")
+    return per_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("frame", nargs="?", default=DEFAULT_FRAME)
+    parser.add_argument("-n", "--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    pix = load_pix(args.frame)
+    disp = make_display(RecordingSpi())
+    print(f"frame {pix.shape[1]}x{pix.shape[0]}, {pix.nbytes} bytes, {args.frames} frames")
+    old = run("list", send_list, disp, pix, args.frames)
+    new = run("buffer", send_buffer, disp, pix, args.frames)
+    print(f"speedup  {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Recording stand-ins for the hardware objects used by lib/lcdconfig.py.
+
+They keep the same call surface as spidev.SpiDev and gpiozero's output
+devices so the drivers can be exercised without touching the bus. Every
+write is copied into a bytes object, which is roughly what spidev does
+when it fills its transfer buffer, so the timings compare Python-side
+overhead fairly.
+"""
+
+
+class RecordingSpi:
+    """Stand-in for spidev.SpiDev that records every transfer"""
+
+    def __init__(self, bufsiz=4096):
+        self.bufsiz = bufsiz
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.calls = 0
+        self.transfers = 0
+        self.bytes_written = 0
+
+    def writebytes(self, values):
+        if len(values) > self.bufsiz:
+            raise OverflowError("writebytes is limited to %d bytes" % self.bufsiz)
+        payload = bytes(values)
+        self.calls += 1
+        self.transfers += 1
+        self.bytes_written += len(payload)
+
+    def writebytes2(self, values):
+        if isinstance(values, list):
+            payload = bytes(values)
+        else:
+            payload = memoryview(values).cast('B').tobytes()
+        self.calls += 1
+        # spidev splits the buffer into bufsiz sized ioctl transfers
+        self.transfers += (len(payload) + self.bufsiz - 1) // self.bufsiz
+        self.bytes_written += len(payload)
+
+    def reset(self):
+        self.calls = 0
+        self.transfers = 0
+        self.bytes_written = 0
+
+    def close(self):
+        pass
+
+
+class RecordingPin:
+    """Stand-in for a gpiozero DigitalOutputDevice that counts writes and transitions"""
+
+    def __init__(self):
+        self.value = 0
+        self.writes = 0
+        self.transitions = 0
+
+    def on(self):
+        self.writes += 1
+        if not self.value:
+            self.transitions += 1
+        self.value = 1
+
+    def off(self):
+        self.writes += 1
+        if self.value:
+            self.transitions += 1
+        self.value = 0
+
+    def close(self):
+        pass
@@ -0,0 +1,342 @@
+#display with emotions/command_server.py
+"""
+Commands over a local socket, for driving the robot from another process.
+
+Until now commands only came from stdin, one line at a time, so scripts
+needed a pty. The command server listens on a UNIX domain socket or a
+localhost TCP port and posts every command it receives to the player's
+command queue, as typed commands are:
+
+    LCD_COMMAND_SOCKET=/tmp/emo.sock python new.py
+    LCD_COMMAND_SOCKET=9102 python robot_runtime.py     # 127.0.0.1:9102
+
+One thread serves every client with non-blocking sockets and a selector,
+so a slow or idle client never holds up the others or the player. A
+client may send many commands in one write, each either
+
+    a line            happy\\n
+    length-prefixed   a 4-byte big-endian length, then that many bytes
+
+(a line never starts with a zero byte, so the two mix freely). Every
+command is acknowledged, in the framing it came in, with a JSON object:
+
+    {"seq": 1, "command": "happy", "received": 1760668800.123456, "queued": 1760668800.123470}
+
+seq counts the connection's commands; received is when its bytes were
+read and queued when it was posted, both time.time(). From a shell:
+
+    python command_server.py /tmp/emo.sock happy sad
+
+Nothing authenticates a client, so a TCP server only listens on a
+loopback address unless it is built with allow_remote (LCD_COMMAND_REMOTE=1
+for the player); anyone who can reach the port can then drive the robot.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import ipaddress
+import argparse
+import selectors
+import threading
+
+MAX_COMMAND = 4096  # bytes; longer commands close the connection
+MAX_PENDING = 1 << 20  # bytes of acks waiting for a client that does not read them
+
+
+def parse_address(address):
+    """
+    (family, address) to listen on or connect to.
+
+    Args:
+        address: A port on 127.0.0.1 (all digits), 'host:port', or else
+                 a UNIX socket path, e.g. emo.sock or /tmp/emo.sock
+    """
+    address = str(address)
+    host, _, port = address.rpartition(':')
+    if port.isdigit() and '/' not in address:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+def is_loopback(host):
+    """Whether host, a name or IP address, is this machine's loopback interface"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # any other name may resolve to a public interface
+
+
+class _Client:
+    def __init__(self, sock, name):
+        self.sock = sock
+        self.name = name
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.seq = 0
+
+
+class CommandServer:
+    """
+    Serves commands to post from one daemon thread.
+
+    Args:
+        post: Called with each command, stripped and lower-cased, from the server thread
+        address: Where to listen, see parse_address
+        max_command: Longest command accepted, in bytes
+        allow_remote: Listen on a TCP address other than loopback; clients are not authenticated
+
+    Raises:
+        ValueError: If address is a TCP address off loopback and allow_remote is not set
+    """
+
+    def __init__(self, post, address, max_command=MAX_COMMAND, allow_remote=False):
+        self.post = post
+        self.family, self.address = parse_address(address)
+        if self.family == socket.AF_INET and not allow_remote and not is_loopback(self.address[0]):
+            raise ValueError(f"{self.address[0]} is not a loopback address; commands are not "
+                             f"authenticated, so listening there needs allow_remote (LCD_COMMAND_REMOTE=1)")
+        self.max_command = max_command
+        self.commands = 0
+        self.connections = 0
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._wakeup = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """Listen and serve from a daemon thread"""
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)  # left by a previous run
+        listener = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self.address)
+        listener.listen(16)
+        listener.setblocking(False)
+        if self.family == socket.AF_INET:
+            self.address = listener.getsockname()  # the port, when 0 was asked for
+        self._listener = listener
+        self._selector.register(listener, selectors.EVENT_READ)
+        # Written to by close() to wake the selector
+        self._wakeup, wakeup = socket.socketpair()
+        wakeup.setblocking(False)
+        self._selector.register(wakeup, selectors.EVENT_READ)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="command-server")
+        self._thread.daemon = True
+        self._thread.start()
+        if self.family == socket.AF_INET:
+            host, port = self.address[:2]
+            if is_loopback(host):
+                logging.info(f"Commands on {host}:{port}")
+            else:
+                logging.warning(f"Commands on {host}:{port}, open to other hosts without authentication")
+        else:
+            logging.info(f"Commands on {self.address}")
+
+    def close(self, timeout=1.0):
+        """Stop serving and close every connection"""
+        if self._thread is None:
+            return
+        self._running = False
+        try:
+            self._wakeup.send(b'\0')
+        except OSError:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+        logging.info(f"Command server closed: {self.commands} commands from {self.connections} connections")
+
+    def _serve(self):
+        try:
+            while self._running:
+                for key, events in self._selector.select():
+                    if key.fileobj is self._listener:
+                        self._accept()
+                    elif key.data is None:
+                        self._running = False  # woken by close()
+                    else:
+                        if events & selectors.EVENT_READ:
+                            self._read(key.data)
+                        if events & selectors.EVENT_WRITE and key.data.sock.fileno() >= 0:
+                            self._flush(key.data)
+        finally:
+            for key in list(self._selector.get_map().values()):
+                key.fileobj.close()
+            self._selector.close()
+            self._wakeup.close()
+            if self.family == socket.AF_UNIX:
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
+
+    def _accept(self):
+        try:
+            sock, peer = self._listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        if self.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _Client(sock, peer or 'unix client')
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        self.connections += 1
+        logging.debug(f"Command client connected: {client.name}")
+
+    def _drop(self, client, reason=None):
+        if client.sock.fileno() < 0:
+            return  # dropped already
+        if reason:
+            logging.warning(f"Dropping command client {client.name}: {reason}")
+        self._selector.unregister(client.sock)
+        client.sock.close()
+
+    def _read(self, client):
+        try:
+            data = client.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._drop(client, e)
+            return
+        if not data:
+            self._drop(client)
+            return
+        received = time.time()
+        client.inbox += data
+        for command, framed in self._split(client):
+            if command is None:
+                self._reply(client, {'error': f"command longer than {self.max_command} bytes"}, framed)
+                self._flush(client)
+                self._drop(client, "command too long")
+                return
+            command = command.decode('utf-8', 'replace').strip().lower()
+            if not command:
+                continue
+            self.post(command)
+            self.commands += 1
+            client.seq += 1
+            self._reply(client, {'seq': client.seq, 'command': command,
+                                 'received': round(received, 6), 'queued': round(time.time(), 6)}, framed)
+        # One send for the acks of the whole batch
+        if client.outbox:
+            self._flush(client)
+
+    def _split(self, client):
+        """(command bytes, length-prefixed) of each complete command in the client's inbox"""
+        inbox = client.inbox
+        pos = 0
+        try:
+            while pos < len(inbox):
+                if inbox[pos] == 0:
+                    if len(inbox) - pos < 4:
+                        break
+                    size = int.from_bytes(inbox[pos:pos + 4], 'big')
+                    if size > self.max_command:
+                        yield None, True
+                        return
+                    if len(inbox) - pos - 4 < size:
+                        break
+                    yield bytes(inbox[pos + 4:pos + 4 + size]), True
+                    pos += 4 + size
+                else:
+                    end = inbox.find(b'\n', pos)
+                    if end < 0:
+                        if len(inbox) - pos > self.max_command:
+                            yield None, False
+                            return
+                        break
+                    if end - pos > self.max_command:
+                        yield None, False
+                        return
+                    yield bytes(inbox[pos:end]), False
+                    pos = end + 1
+        finally:
+            del inbox[:pos]
+
+    def _reply(self, client, ack, framed):
+        body = json.dumps(ack, separators=(',', ':')).encode()
+        if framed:
+            client.outbox += len(body).to_bytes(4, 'big') + body
+        else:
+            client.outbox += body + b'\n'
+
+    def _flush(self, client):
+        """Send what the client will take now; the rest when it can take more"""
+        try:
+            sent = client.sock.send(client.outbox)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            self._drop(client, e)
+            return
+        del client.outbox[:sent]
+        if len(client.outbox) > MAX_PENDING:
+            self._drop(client, "not reading its acks")
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbox else 0)
+        if self._selector.get_key(client.sock).events != events:
+            self._selector.modify(client.sock, events, client)
+
+
+def send_commands(address, commands, framed=False, timeout=5.0):
+    """
+    Send commands in one batch and wait for their acks.
+
+    Args:
+        address: Server address, see parse_address
+        commands: Command strings
+        framed: Length-prefix the commands instead of sending lines
+
+    Returns:
+        The acks, as dicts, in order
+    """
+    family, address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        batch = bytearray()
+        for command in commands:
+            body = command.encode()
+            batch += len(body).to_bytes(4, 'big') + body if framed else body + b'\n'
+        sock.sendall(batch)
+        expected = sum(1 for command in commands if command.strip())
+        acks = []
+        reader = sock.makefile('rb')
+        while len(acks) < expected:
+            if framed:
+                header = reader.read(4)
+                if len(header) < 4:
+                    break
+                body = reader.read(int.from_bytes(header, 'big'))
+            else:
+                body = reader.readline()
+                if not body:
+                    break
+            acks.append(json.loads(body))
+            if 'error' in acks[-1]:
+                break
+        return acks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send commands to a running player")
+    parser.add_argument('address', help="socket path, host:port or port (LCD_COMMAND_SOCKET of the player)")
+    parser.add_argument('commands', nargs='+', help="commands, sent in one batch")
+    parser.add_argument('--framed', action='store_true', help="length-prefix the commands instead of sending lines")
+    args = parser.parse_args(argv)
+    for ack in send_commands(args.address, args.commands, args.framed):
+        print(json.dumps(ack))
+        if 'error' in ack:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
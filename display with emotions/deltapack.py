@@ -0,0 +1,300 @@
+#display with emotions/deltapack.py
+"""
+Keyframe + delta compressed animations.
+
+Consecutive frames of an emotion differ in a small part of the screen
+(on average 6% of the 16x16 tiles in sleep, 14% in neutral, 43% in
+dizzy), so a delta pack stores a full keyframe every keyframe_interval
+frames and, for the frames in between, only the tiles that changed since
+the previous frame:
+
+    keyframe   zlib(frame)
+    delta      bitmap of changed tiles, one bit per tile in row order,
+               then zlib(the changed tiles, in bitmap order)
+
+Frames are big-endian RGB565 as the panel takes them, so decoding is
+zlib plus a vectorized scatter of the changed tiles into the current
+frame, with no PNG decode and no colour conversion. Compared with a frame
+pack (framepack.py) it trades that small decode for a pack several times
+smaller, which means fewer SD-card reads and less page cache.
+
+Layout (little-endian):
+
+    header   magic 'DPK1', version, width, height, tile size, keyframe
+             interval, frame count, fps, index offset, data offset, name
+    index    one (data offset, size in bytes, changed tiles, keyframe) per frame
+    data     the frame records
+
+Compile packs, into packs/ next to the player whatever the current directory, with:
+
+    python deltapack.py                  # every emotion, into packs/
+    python deltapack.py dizzy angry --keyframe-interval 60
+"""
+import os
+import mmap
+import zlib
+import struct
+import logging
+import threading
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from lib import rgb565
+from framepack import BASE_DIR, emotion_frame_paths
+from emotions import EMOTION_SPEEDS
+
+MAGIC = b'DPK1'
+VERSION = 1
+EXTENSION = '.dpk'
+
+# magic, version, width, height, tile, keyframe interval, count, fps, index offset, data offset, name
+_HEADER = struct.Struct('<4sHHHHH2xIfII32s')
+_INDEX = np.dtype([('offset', '<u8'), ('nbytes', '<u4'), ('tiles', '<u2'), ('keyframe', 'u1'), ('reserved', 'u1')])
+
+
+def pack_path(pack_dir, emotion):
+    """Path of the delta pack for an emotion"""
+    return os.path.join(pack_dir, emotion + EXTENSION)
+
+
+def tile_view(frame, tile):
+    """(rows, cols, tile, tile, 2) view of an (h, w, 2) frame, one entry per tile"""
+    height, width = frame.shape[:2]
+    return frame.reshape(height // tile, tile, width // tile, tile, 2).swapaxes(1, 2)
+
+
+def compile_delta_pack(frame_paths, out_path, fps, keyframe_interval=30, tile=16, name='', level=9):
+    """
+    Compile PNG frames into a delta pack.
+
+    Args:
+        frame_paths: Frame images in playback order
+        out_path: Pack file to write
+        fps: Frame rate recorded in the header
+        keyframe_interval: Frames between full keyframes; frame 0 is always one
+        tile: Tile size in pixels, must divide the frame width and height
+        name: Name stored in the header, usually the emotion
+        level: zlib compression level
+
+    Returns:
+        Number of frames written
+    """
+    if not frame_paths:
+        raise ValueError(f"No frames to pack into {out_path}")
+    count = len(frame_paths)
+    width, height = Image.open(frame_paths[0]).size
+    if width % tile or height % tile:
+        raise ValueError(f"Tile size {tile} does not divide {width}x{height}")
+    converter = rgb565.RGB565Converter(width, height)
+    previous = converter.new_buffer()
+    current = converter.new_buffer()
+
+    index_offset = _HEADER.size
+    data_offset = index_offset + count * _INDEX.itemsize
+    index = np.zeros(count, dtype=_INDEX)
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * data_offset)
+        for i, path in enumerate(frame_paths):
+            converter.convert(Image.open(path), out=current)
+            if i % keyframe_interval == 0:
+                record = zlib.compress(current.tobytes(), level)
+                index[i]['tiles'] = (width // tile) * (height // tile)
+                index[i]['keyframe'] = 1
+            else:
+                tiles = tile_view(current, tile)
+                changed = (tiles != tile_view(previous, tile)).any(axis=(2, 3, 4))
+                record = np.packbits(changed).tobytes() + zlib.compress(tiles[changed].tobytes(), level)
+                index[i]['tiles'] = changed.sum()
+            index[i]['offset'] = f.tell()
+            index[i]['nbytes'] = len(record)
+            f.write(record)
+            previous, current = current, previous
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, width, height, tile, keyframe_interval, count, fps,
+                             index_offset, data_offset, name.encode()[:32]))
+        f.write(index.tobytes())
+    os.replace(tmp_path, out_path)
+    return count
+
+
+class DeltaPack:
+    """
+    A compiled delta pack, memory-mapped for playback.
+
+    Behaves like a read-only sequence of (height, width, 2) RGB565 frames.
+    Frames are decoded into one working frame, in place: playing forward
+    applies one delta per frame, and jumping elsewhere restarts from the
+    closest keyframe at or before the target. Indexing returns a copy of
+    the working frame, which the caller may keep; frame(i, out) decodes
+    into a buffer of the caller's instead. Decoding is serialized, so
+    indexing is safe from several threads.
+    """
+
+    rotation = 0  # frames are stored as drawn, the controller rotates them
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f"{self.path} is not a delta pack")
+        (magic, version, self.width, self.height, self.tile, self.keyframe_interval, count,
+         self.fps, index_offset, data_offset, name) = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a delta pack")
+        if version != VERSION:
+            raise ValueError(f"{self.path} has pack version {version}, expected {VERSION}")
+        if not count or self.width % self.tile or self.height % self.tile:
+            raise ValueError(f"{self.path} is corrupt")
+        self.name = name.rstrip(b'\0').decode()
+
+        self.index = np.frombuffer(self._mmap, dtype=_INDEX, count=count, offset=index_offset)
+        ends = self.index['offset'] + self.index['nbytes']
+        if int(ends.max()) > len(self._mmap) or not self.index[0]['keyframe']:
+            raise ValueError(f"{self.path} is truncated or corrupt")
+        self._keyframes = np.flatnonzero(self.index['keyframe'])
+        self._grid = (self.height // self.tile, self.width // self.tile)
+        self._mask_bytes = -(-self._grid[0] * self._grid[1] // 8)
+
+        self._frame = np.zeros((self.height, self.width, 2), dtype=np.uint8)
+        self._tiles = tile_view(self._frame, self.tile)
+        self._position = -1  # index of the frame held in _frame
+
+    def __len__(self):
+        return 0 if self.index is None else len(self.index)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("frame index out of range")
+        return self.frame(i, out=np.empty_like(self._frame))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def frame(self, i, out=None):
+        """
+        Decode frame i.
+
+        Returns:
+            out with the frame copied in, or the working frame itself, which
+            the next call overwrites, when out is None
+        """
+        with self._lock:
+            if i != self._position:
+                keyframe = int(self._keyframes[np.searchsorted(self._keyframes, i, 'right') - 1])
+                # Carry on from the working frame unless a keyframe is closer
+                start = self._position + 1 if keyframe <= self._position < i else keyframe
+                for j in range(start, i + 1):
+                    self._apply(j)
+                self._position = i
+            if out is None:
+                return self._frame
+            np.copyto(out, self._frame)
+            return out
+
+    def _apply(self, i):
+        offset, nbytes, tiles, keyframe, _ = self.index[i]
+        record = memoryview(self._mmap)[int(offset):int(offset) + int(nbytes)]
+        try:
+            if keyframe:
+                self._frame.reshape(-1)[:] = np.frombuffer(zlib.decompress(record), dtype=np.uint8)
+                return
+            if not tiles:
+                return
+            mask = np.unpackbits(np.frombuffer(record[:self._mask_bytes], dtype=np.uint8),
+                                 count=self._grid[0] * self._grid[1]).view(bool).reshape(self._grid)
+            payload = np.frombuffer(zlib.decompress(record[self._mask_bytes:]), dtype=np.uint8)
+            self._tiles[mask] = payload.reshape(-1, self.tile, self.tile, 2)
+        finally:
+            record.release()
+
+    def repeats(self):
+        """Whether each frame is identical to the one before it: a delta with no changed tiles"""
+        return (self.index['tiles'] == 0) & (self.index['keyframe'] == 0)
+
+    def nbytes(self):
+        """Size of the compressed frame records"""
+        return int(self.index['nbytes'].sum())
+
+    def raw_nbytes(self):
+        """Size of the frames once decoded"""
+        return len(self) * self.width * self.height * 2
+
+    def close(self):
+        """Unmap the pack"""
+        self.index = None
+        self._keyframes = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return (f"DeltaPack({self.name!r}, {len(self)} frames, "
+                f"{self.width}x{self.height}, {self.fps:g} fps)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile emotion frame directories into delta packs")
+    parser.add_argument('emotions', nargs='*',
+                        help="emotions to compile (default: every emotion the player knows)")
+    parser.add_argument('--src', default=BASE_DIR, help="directory holding the emotion directories")
+    parser.add_argument('--out', default=os.path.join(BASE_DIR, 'packs'), help="directory to write the packs to")
+    parser.add_argument('--fps', type=float, help="frame rate for every pack (default: the player's emotion_speeds)")
+    parser.add_argument('--keyframe-interval', type=int, default=30, help="frames between keyframes")
+    parser.add_argument('--tile', type=int, default=16, help="tile size in pixels")
+    args = parser.parse_args(argv)
+
+    speeds = {}
+    if args.fps is None or not args.emotions:
+        speeds = EMOTION_SPEEDS
+    emotions = args.emotions or list(speeds)
+
+    for emotion in emotions:
+        fps = args.fps or speeds.get(emotion)
+        if not fps:
+            parser.error(f"No frame rate known for {emotion}, pass --fps")
+        frames = emotion_frame_paths(args.src, emotion)
+        if not frames:
+            logging.warning(f"No frames found for {emotion}, skipped")
+            continue
+        out_path = pack_path(args.out, emotion)
+        count = compile_delta_pack(frames, out_path, fps, args.keyframe_interval, args.tile, emotion)
+        png_bytes = sum(os.path.getsize(p) for p in frames)
+        logging.info(f"Packed {count} frames of {emotion} into {out_path} "
+                     f"({os.path.getsize(out_path) / 1e6:.1f} MB, PNGs {png_bytes / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
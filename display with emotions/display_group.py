@@ -0,0 +1,203 @@
+#display with emotions/display_group.py
+"""
+Several LCD panels showing one frame source, e.g. one panel per eye.
+
+Every panel gets its own driver (SPI device, DC, RST and backlight pins)
+and its own DisplayWriter thread, so the transfers to the panels run side
+by side. A frame is decoded and converted once and the same RGB565 array
+is queued to every writer; per-panel work is limited to an optional crop,
+which is a view of the frame when its size matches the panel. Mirroring
+is done by the panel's controller (set_orientation), at no cost per frame.
+
+The group is submitted to like a single DisplayWriter, at the frame's
+deadline, so the panels stay in step: with the 'block' policy a panel
+that falls behind holds back the next frame for all of them.
+
+Panels on the same SPI controller (SPI0 CE0 and CE1) share its bandwidth;
+the kernel interleaves their transfers. A panel on SPI1 gets a bus of its
+own.
+"""
+import time
+import logging
+
+import numpy as np
+
+from lib import LCD_2inch, rgb565
+from display_writer import DisplayWriter
+
+
+class PanelSpec:
+    """Wiring and placement of one panel in a group"""
+
+    def __init__(self, name, bus=0, device=0, rst=27, dc=25, bl=18, spi_freq=40000000,
+                 rotation=0, mirror=False, crop=None):
+        """
+        Args:
+            name: Panel name, used in messages and statistics
+            bus, device: SPI bus and chip select (device 1 is CE1)
+            rst, dc, bl: GPIO pins of the panel's reset, data/command and backlight lines
+            spi_freq: SPI clock in Hz
+            rotation: 0 or 180 degrees, applied by the controller
+            mirror: Mirror frames left to right, applied by the controller
+            crop: (x, y, width, height) of the source frame to show, or None
+                  for all of it; scaled to the panel when the sizes differ.
+                  Source frames are the size of the group's first panel.
+        """
+        self.name = name
+        self.bus = bus
+        self.device = device
+        self.rst = rst
+        self.dc = dc
+        self.bl = bl
+        self.spi_freq = spi_freq
+        self.rotation = rotation
+        self.mirror = mirror
+        self.crop = tuple(crop) if crop is not None else None
+
+    def __repr__(self):
+        return f"PanelSpec({self.name!r}, spi{self.bus}.{self.device})"
+
+
+# Two eyes on SPI0: the original wiring on CE0, a second panel on CE1
+# mirrored so the pair faces each other
+EYES = [
+    PanelSpec('left', device=0, rst=27, dc=25, bl=18),
+    PanelSpec('right', device=1, rst=22, dc=24, bl=13, mirror=True),
+]
+
+
+class _Crop:
+    """Takes a panel's part of a source frame: a view, or a nearest-neighbour scale"""
+
+    def __init__(self, crop, width, height):
+        x, y, w, h = crop
+        self.slices = (slice(y, y + h), slice(x, x + w))
+        self.scaled = (w, h) != (width, height)
+        if self.scaled:
+            self.rows = (y + np.arange(height) * h // height)[:, None]
+            self.cols = x + np.arange(width) * w // width
+
+    def __call__(self, pix):
+        if self.scaled:
+            return pix[self.rows, self.cols]
+        return pix[self.slices]
+
+
+class DisplayGroup:
+    """
+    Panels driven together, with the submit/flush/stop interface of DisplayWriter.
+
+    Args:
+        specs: PanelSpec per panel
+        driver: Panel driver class
+        buffers: Frame buffers of each panel's writer
+        policy: Writer policy, 'block' keeps the panels in step
+        partial_update: Only resend changed regions, tracked per panel
+        rotation: Rotation applied on top of each panel's own
+        telemetry: Telemetry for the writers and the shared conversion, or None
+    """
+
+    def __init__(self, specs, driver=LCD_2inch.LCD_2inch, buffers=3, policy='block',
+                 partial_update=False, rotation=0, telemetry=None):
+        if not specs:
+            raise ValueError("A display group needs at least one panel")
+        self.specs = list(specs)
+        self.driver = driver
+        self.buffers = buffers
+        self.policy = policy
+        self.partial_update = partial_update
+        self.rotation = rotation
+        self.telemetry = telemetry
+        self.displays = []
+        self.writers = []
+        self._crops = []
+        self.converter = None
+        self._ring = []  # conversion buffers, reused in turn
+        self._next = 0
+
+    def open(self, brightness=50):
+        """Initialize every panel and start its writer"""
+        for spec in self.specs:
+            disp = self.driver(spi=(spec.bus, spec.device), spi_freq=spec.spi_freq,
+                               rst=spec.rst, dc=spec.dc, bl=spec.bl)
+            self.displays.append(disp)
+            disp.Init()
+            disp.partial_update = self.partial_update
+            disp.set_orientation(rotation=(spec.rotation + self.rotation) % 360, mirror=spec.mirror)
+            disp.clear()
+            disp.bl_DutyCycle(brightness)
+            # Landscape frames, as the player sends them
+            if spec.crop:
+                x, y, w, h = spec.crop
+                source = self.displays[0]
+                if x < 0 or y < 0 or x + w > source.height or y + h > source.width:
+                    raise ValueError(f"Crop {spec.crop} of {spec.name} is outside the "
+                                     f"{source.height}x{source.width} source frames")
+            self._crops.append(_Crop(spec.crop, disp.height, disp.width) if spec.crop else None)
+            writer = DisplayWriter(disp, self.buffers, self.policy, telemetry=self.telemetry, panel=spec.name)
+            writer.start()
+            self.writers.append(writer)
+        self.converter = rgb565.RGB565Converter(self.width, self.height)
+        # A writer holds at most `buffers` frames (queued and being sent) once
+        # submit returns, so the buffer converted that many frames plus one ago
+        # is free again
+        self._ring = [self.converter.new_buffer() for _ in range(self.buffers + 1)]
+        logging.info(f"Display group of {len(self.displays)} panels: {self.specs}")
+
+    @property
+    def width(self):
+        """Width of the source frames: the first panel's landscape width"""
+        return self.displays[0].height
+
+    @property
+    def height(self):
+        """Height of the source frames"""
+        return self.displays[0].width
+
+    def submit(self, frame):
+        """
+        Queue a frame on every panel. Returns once every writer has queued it.
+
+        Args:
+            frame: As for DisplayWriter.submit. Images are converted once,
+                   here, into a ring of reused buffers, and the RGB565
+                   frame is shared by the panels.
+        """
+        if not (isinstance(frame, np.ndarray) and frame.ndim == 3 and frame.shape[2] == 2):
+            started = time.perf_counter()
+            buf = self._ring[self._next]
+            self._next = (self._next + 1) % len(self._ring)
+            frame = self.converter.convert(frame, out=buf)
+            if self.telemetry is not None:
+                self.telemetry.observe('frame_convert_seconds', "RGB565 conversion time per frame",
+                                       time.perf_counter() - started)
+        queued = True
+        for writer, crop in zip(self.writers, self._crops):
+            queued = writer.submit(crop(frame) if crop else frame) and queued
+        return queued
+
+    def flush(self, timeout=None):
+        """Wait until every panel has written its queued frames"""
+        return all([writer.flush(timeout) for writer in self.writers])
+
+    def queue_depth(self):
+        """Frames waiting on the slowest panel"""
+        return max(writer.queue_depth() for writer in self.writers)
+
+    def stop(self, flush=False, timeout=None):
+        for writer in self.writers:
+            writer.stop(flush, timeout)
+
+    def stats(self):
+        """Writer counters per panel"""
+        return {spec.name: writer.stats() for spec, writer in zip(self.specs, self.writers)}
+
+    def close(self, clear=True):
+        """Release every panel, clearing it first by default"""
+        for disp in self.displays:
+            try:
+                if clear:
+                    disp.clear()
+                disp.module_exit()
+            except Exception as e:
+                logging.warning(f"Could not release panel: {e}")
@@ -0,0 +1,238 @@
+#display with emotions/display_writer.py
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from lib import rgb565
+from telemetry import FRAMES
+
+
+class DisplayWriter:
+    """
+    Background writer that owns the SPI transfer to the LCD.
+
+    Frames are converted to RGB565 on the submitting thread, into one of a
+    small ring of reusable buffers, and sent by a writer thread. Decoding and
+    converting frame N+1 therefore overlaps with the transfer of frame N, and
+    the frame rate is bounded by the slowest stage instead of their sum.
+
+    When every buffer is in use, submit() either waits for the writer
+    (policy 'block', back-pressure) or discards the oldest frame that has not
+    been sent yet (policy 'drop_oldest').
+    """
+
+    POLICIES = ('block', 'drop_oldest')
+
+    def __init__(self, disp, buffers=3, policy='block', width=None, height=None,
+                 telemetry=None, panel=None):
+        """
+        Args:
+            disp: Initialized LCD driver with a ShowBuffer method
+            buffers: Number of reusable frame buffers (at least 2)
+            policy: 'block' or 'drop_oldest'
+            width, height: Frame size, landscape panel size by default
+            telemetry: Telemetry to record convert and transfer times and
+                       queue depths in (see telemetry.py), or None
+            panel: Panel name to label the transfer times with
+        """
+        if buffers < 2:
+            raise ValueError("DisplayWriter needs at least 2 buffers")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {self.POLICIES}")
+        self.disp = disp
+        self.policy = policy
+        self.telemetry = telemetry
+        self._labels = {'panel': panel} if panel else {}
+        self.width = width or disp.height
+        self.height = height or disp.width
+
+        self.converter = rgb565.RGB565Converter(self.width, self.height)
+        self._free = [self.converter.new_buffer() for _ in range(buffers)]
+        self._pending = deque()  # (pix, owned) waiting for the writer
+        self._depth = buffers - 1  # one buffer is always free for the writer
+        self._busy = False
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        # Counters
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked_time = 0.0
+
+    def start(self):
+        """Start the writer thread"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="display-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, flush=False, timeout=None):
+        """
+        Stop the writer thread.
+
+        Args:
+            flush: Send frames still queued before stopping instead of dropping them
+            timeout: Seconds to wait for the thread to finish
+        """
+        if self._thread is None:
+            return
+        if flush:
+            self.flush(timeout)
+        with self._cond:
+            self._running = False
+            while self._pending:
+                self._release(self._pending.popleft())
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+        logging.info("Display writer stopped: %s", self.stats())
+
+    def submit(self, frame):
+        """
+        Queue a frame for display. Returns as soon as the frame is queued.
+
+        Args:
+            frame: PIL image or RGB array, converted here into a free buffer,
+                   or an (h, w, 2) RGB565 array, which is queued as is and
+                   must not be modified afterwards
+
+        Returns:
+            True if the frame was queued, False if the writer is stopped
+        """
+        if isinstance(frame, np.ndarray) and frame.ndim == 3 and frame.shape[2] == 2:
+            item = (frame, False)
+        else:
+            buf = self._acquire()
+            if buf is None:
+                return False
+            try:
+                started = time.perf_counter()
+                self.converter.convert(frame, out=buf)
+                if self.telemetry is not None:
+                    self.telemetry.observe('frame_convert_seconds', "RGB565 conversion time per frame",
+                                           time.perf_counter() - started)
+            except Exception:
+                with self._cond:
+                    self._free.append(buf)
+                    self._cond.notify_all()
+                raise
+            item = (buf, True)
+
+        with self._cond:
+            self._make_room()
+            if not self._running:
+                self._release(item)
+                return False
+            self._pending.append(item)
+            self.submitted += 1
+            if self.telemetry is not None:
+                self.telemetry.observe('writer_queue_frames', "Frames waiting for the display writer, per submit",
+                                       len(self._pending), FRAMES, **self._labels)
+            self._cond.notify_all()
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until every queued frame has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running and (self._pending or self._busy):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def queue_depth(self):
+        """Number of frames waiting to be written"""
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        """Counters as a dict"""
+        with self._cond:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'pending': len(self._pending),
+                'blocked_s': round(self.blocked_time, 3),
+            }
+
+    def _acquire(self):
+        """Take a free buffer, waiting or dropping the oldest frame per policy"""
+        with self._cond:
+            started = None
+            while self._running and not self._free:
+                if self.policy == 'drop_oldest' and self._drop_oldest(owned_only=True):
+                    break
+                if started is None:
+                    started = time.monotonic()
+                self._cond.wait()
+            if started is not None:
+                self.blocked_time += time.monotonic() - started
+            if not self._running:
+                return None
+            return self._free.pop()
+
+    def _make_room(self):
+        """Ensure the pending queue has room for one more frame; lock held"""
+        started = None
+        while self._running and len(self._pending) >= self._depth:
+            if self.policy == 'drop_oldest':
+                self._drop_oldest()
+                continue
+            if started is None:
+                started = time.monotonic()
+            self._cond.wait()
+        if started is not None:
+            self.blocked_time += time.monotonic() - started
+
+    def _drop_oldest(self, owned_only=False):
+        """Discard the oldest queued frame; lock held"""
+        for i, item in enumerate(self._pending):
+            if item[1] or not owned_only:
+                del self._pending[i]
+                self._release(item)
+                self.dropped += 1
+                return True
+        return False
+
+    def _release(self, item):
+        """Return a frame's buffer to the free list; lock held"""
+        pix, owned = item
+        if owned:
+            self._free.append(pix)
+        self._cond.notify_all()
+
+    def _run(self):
+        """Writer thread: send queued frames in order"""
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                item = self._pending.popleft()
+                self._busy = True
+                self._cond.notify_all()
+
+            try:
+                started = time.perf_counter()
+                self.disp.ShowBuffer(item[0])
+                if self.telemetry is not None:
+                    self.telemetry.observe('frame_transfer_seconds', "SPI transfer time per frame",
+                                           time.perf_counter() - started, **self._labels)
+            except Exception as e:
+                logging.error(f"Display writer failed to send frame: {e}")
+
+            with self._cond:
+                self._busy = False
+                self.written += 1
+                self._release(item)
@@ -0,0 +1,18 @@
+#display with emotions/emotions.py
+"""
+The emotions the robot knows and their frame rates.
+
+Shared by the player (new.py) and the offline tools (framepack.py,
+deltapack.py, manifest.py, the benchmarks), which need the rates
+without starting the player.
+"""
+
+# Frame rates for each emotion (fps)
+EMOTION_SPEEDS = {
+    'bootup': 20, 'bootup3': 20, 'neutral': 20, 'angry': 60,
+    'blink': 40, 'blink2': 40, 'dizzy': 90, 'excited': 10,
+    'happy': 20, 'happy2': 20, 'happy3': 20, 'sad': 20, 'sleep': 15
+}
+
+# Emotions played on command from neutral, through a transition clip
+EMOTIONS = ['angry', 'blink', 'blink2', 'dizzy', 'excited', 'happy', 'happy2', 'happy3', 'sad']
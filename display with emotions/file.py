@@ -2,13 +2,17 @@ import cv2
 import os
 import glob
 import threading
-from queue import Queue
+from queue import Queue, Empty
 import time
 import numpy as np
 import signal
 import sys
 import re
 
+from manifest import Manifest, MANIFEST_FILE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class RobotEmotions:
     def __init__(self):
         # Core state management
@@ -56,12 +60,23 @@ class RobotEmotions:
     def load_sorted_frames(self):
         """
         Load and sort frames for each emotion based on frame number.
-        Uses natural sorting to ensure correct frame sequence.
+        Frame lists, sizes and rates come from the manifest (see
+        manifest.py) when there is one; otherwise natural sorting is used
+        to ensure correct frame sequence.
         """
+        manifest = Manifest.load(os.path.join(BASE_DIR, MANIFEST_FILE))
         found_dimensions = False
         for emotion in self.emotion_frames:
-            # Get and sort all PNG files in the emotion directory
-            frames = sorted(glob.glob(f"{emotion}/frame*.png"), key=self.natural_sort_key)
+            if manifest is not None and emotion in manifest:
+                frames = manifest.frame_paths(emotion)
+                self.emotion_speeds[emotion] = manifest.fps(emotion)
+                if not found_dimensions:
+                    self.frame_width, self.frame_height = manifest.size(emotion)
+                    found_dimensions = True
+            else:
+                # Get and sort all PNG files in the emotion directory
+                frames = sorted(glob.glob(os.path.join(BASE_DIR, emotion, "frame*.png")),
+                                key=self.natural_sort_key)
             self.emotion_frames[emotion] = frames
             print(f"Loaded {len(frames)} frames for {emotion}")
             
@@ -226,15 +241,18 @@ class RobotEmotions:
         print("- exit/quit: Exit program")
         print("\nWaiting for boot command...")
 
-        # Main program loop
+        # Main program loop; blocks on the queue instead of spinning, waking
+        # up now and then to notice the listener stopping
         while self.running:
-            if not self.command_queue.empty():
-                command = self.command_queue.get().strip()
-                if command == 'boot':
-                    self.play_emotion('bootup')
-                    self.play_neutral_loop()
-                elif command in ['exit', 'quit']:
-                    break
+            try:
+                command = self.command_queue.get(timeout=0.5).strip()
+            except Empty:
+                continue
+            if command == 'boot':
+                self.play_emotion('bootup')
+                self.play_neutral_loop()
+            elif command in ['exit', 'quit']:
+                break
 
         # Cleanup on exit
         self.running = False
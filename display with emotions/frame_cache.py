@@ -0,0 +1,103 @@
+#display with emotions/frame_cache.py
+import logging
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    """
+    Memory-budgeted LRU cache of panel-ready RGB565 frames.
+
+    Frames are keyed by their content id from frame_store.py (or the
+    manifest), so a picture repeated within or across emotions is cached
+    once. A frame whose emotion has no ids yet is keyed by (emotion, frame
+    index), as bootup is until the asset loader hashes its frames at boot.
+    Crossfades from transitions.py have keys of their own.
+
+    Frames are evicted least recently used first once their total size
+    exceeds the byte budget. A looping animation larger than the budget
+    would evict every frame before it is reused and push the hot loops
+    out with it, so the player only caches
+    emotions whose whole frame set fits in max_share of the budget (see
+    admits); larger ones, like dizzy, are streamed from disk.
+
+    Cached frames are shared with the display writer and must not be
+    modified. The cache is safe to use from several threads.
+    """
+
+    def __init__(self, budget=32 * 1024 * 1024, max_share=0.6):
+        """
+        Args:
+            budget: Bytes of frame data to keep at most
+            max_share: Largest fraction of the budget one emotion may take
+        """
+        self.budget = budget
+        self.max_share = max_share
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def admits(self, nbytes):
+        """Whether a frame set of nbytes in total should be cached"""
+        return nbytes <= self.budget * self.max_share
+
+    def get(self, key):
+        """Cached frame for key, or None"""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        """Cache a frame, evicting the least recently used ones to stay in budget"""
+        if frame.nbytes > self.budget:
+            return
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._frames[key] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.budget:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Counters as a dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'frames': len(self._frames),
+                'mb': round(self.nbytes / 2**20, 1),
+                'budget_mb': round(self.budget / 2**20, 1),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+    def log_stats(self):
+        logging.info("Frame cache: %s", self.stats())
@@ -0,0 +1,156 @@
+#display with emotions/frame_store.py
+"""
+Content-addressed store of emotion frames.
+
+The same picture turns up many times: animations hold a frame for a
+few steps, emotions share frames, and the emotion directories are copied
+in backup/ and Emo-main/Code/emotions/. The store names every frame by a
+hash of its decoded pixels, so an emotion becomes a list of frame ids and
+each distinct picture is decoded, converted and cached once however many
+files hold it.
+
+Hashing needs a decode, so the frame id of every file is remembered in
+an index file, keyed by path and checked against the file's size and
+modification time; only new or changed files are decoded again.
+
+Report how much of each emotion is unique:
+
+    python frame_store.py                    # this tree, backup/ and Emo-main
+    python frame_store.py . backup --index frame_store.json
+
+The defaults are found next to this file, so it runs from any directory.
+"""
+import os
+import json
+import hashlib
+import logging
+import argparse
+
+from PIL import Image
+
+from framepack import emotion_frame_paths
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = [BASE_DIR, os.path.join(BASE_DIR, 'backup'),
+                   os.path.normpath(os.path.join(BASE_DIR, '..', 'Emo-main', 'Code', 'emotions'))]
+
+
+def frame_hash(path):
+    """Id of the picture in an image file: a hash of its RGB pixels and size"""
+    image = Image.open(path).convert('RGB')
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(repr(image.size).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class FrameStore:
+    """
+    Frames by content hash, and emotion sequences as lists of frame ids.
+
+    Args:
+        index_path: JSON file remembering the id of every file hashed so
+                    far, or None to hash every file each time
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.frames = {}  # frame id -> first file seen holding it
+        self.sequences = {}  # name -> [frame id, ...]
+        self.hashed = 0  # files decoded to hash them
+        self._index = {}  # path -> [size, mtime_ns, frame id]
+        self._dirty = False
+        if index_path and os.path.exists(index_path):
+            try:
+                with open(index_path) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring frame store index {index_path}: {e}")
+
+    def frame_id(self, path):
+        """Id of the frame in a file, hashing it only if the index has no current entry"""
+        path = os.path.normpath(path)
+        st = os.stat(path)
+        entry = self._index.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            fid = entry[2]
+        else:
+            fid = frame_hash(path)
+            self._index[path] = [st.st_size, st.st_mtime_ns, fid]
+            self._dirty = True
+            self.hashed += 1
+        self.frames.setdefault(fid, path)
+        return fid
+
+    def add_sequence(self, name, paths):
+        """Store a sequence of frame files under name; returns its frame ids"""
+        ids = [self.frame_id(path) for path in paths]
+        self.sequences[name] = ids
+        return ids
+
+    def path(self, fid):
+        """A file holding the frame"""
+        return self.frames[fid]
+
+    def save(self):
+        """Write the index if frames were hashed since it was loaded"""
+        if not self.index_path or not self._dirty:
+            return
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def unique_ratio(self, names=None):
+        """Distinct frames over total frames across the named sequences (all by default)"""
+        names = self.sequences if names is None else names
+        ids = [fid for name in names for fid in self.sequences[name]]
+        return len(set(ids)) / len(ids) if ids else 1.0
+
+
+def emotion_dirs(source):
+    """Emotion directories holding frames under source"""
+    if not os.path.isdir(source):
+        return []
+    return sorted(name for name in os.listdir(source) if emotion_frame_paths(source, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report duplicate frames across emotion directories")
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES,
+                        help="directories holding emotion directories (default: this tree, backup/ and Emo-main)")
+    parser.add_argument('--index', default=os.path.join(BASE_DIR, 'frame_store.json'),
+                        help="frame id index to use and update")
+    args = parser.parse_args(argv)
+
+    store = FrameStore(args.index)
+    emotions = {}
+    for source in args.sources:
+        for emotion in emotion_dirs(source):
+            store.add_sequence((source, emotion), emotion_frame_paths(source, emotion))
+            emotions.setdefault(emotion, []).append((source, emotion))
+    store.save()
+
+    # Per source: distinct frames / frames of the emotion there
+    for i, source in enumerate(args.sources, 1):
+        print(f"source {i}: {source}")
+    print(f"{'emotion':13s} " + " ".join(f"{'source ' + str(i):>12s}" for i in range(1, len(args.sources) + 1))
+          + f" {'frames':>7s} {'unique':>7s} {'ratio':>6s}")
+    for emotion, names in sorted(emotions.items()):
+        per_source = {name[0]: store.sequences[name] for name in names}
+        cells = [f"{len(set(per_source[s]))}/{len(per_source[s])}" if s in per_source else "-"
+                 for s in args.sources]
+        total = sum(len(ids) for ids in per_source.values())
+        unique = len(set(fid for ids in per_source.values() for fid in ids))
+        print(f"{emotion:13s} " + " ".join(f"{c:>12s}" for c in cells)
+              + f" {total:7d} {unique:7d} {unique / total:6.2f}")
+    total = sum(len(ids) for ids in store.sequences.values())
+    print(f"{'all':13s} " + " " * (13 * len(args.sources))
+          + f"{total:7d} {len(store.frames):7d} {store.unique_ratio():6.2f}")
+    logging.info(f"Hashed {store.hashed} frame files")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,237 @@
+#display with emotions/framepack.py
+"""
+Precompiled RGB565 frame packs.
+
+A pack holds one emotion as panel-ready frames, already converted to
+big-endian RGB565, so playback does no PNG decoding and no conversion.
+Frames are normally stored as drawn and rotated by the LCD controller;
+the header records any rotation baked in at compile time. The player
+memory-maps the pack and hands each frame to the display writer as a
+read-only view, which spidev sends straight from the page cache.
+
+Layout (little-endian):
+
+    header   magic 'FPK1', version, width, height, rotation, frame count,
+             fps, index offset, data offset, name
+    index    one (data offset, size in bytes, duration in us) per frame
+    data     frames, (height, width, 2) uint8 each, starting on a page boundary
+
+Compile packs, into packs/ next to the player whatever the current directory, with:
+
+    python framepack.py                  # every emotion, into packs/
+    python framepack.py happy sad --fps 20
+"""
+import os
+import re
+import glob
+import mmap
+import struct
+import logging
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from lib import rgb565
+from emotions import EMOTION_SPEEDS
+
+# Emotion directories and packs/ are found next to this file, as the player looks for them
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAGIC = b'FPK1'
+VERSION = 1
+EXTENSION = '.fpk'
+PAGE_SIZE = mmap.PAGESIZE
+
+# magic, version, width, height, rotation, count, fps, index offset, data offset, name
+_HEADER = struct.Struct('<4sHHHHIfII32s4x')
+_INDEX = np.dtype([('offset', '<u8'), ('nbytes', '<u4'), ('duration_us', '<u4')])
+
+
+def natural_sort_key(s):
+    """Sort key that puts "frame2.png" before "frame10.png" """
+    return [int(text) if text.isdigit() else text.lower()
+            for text in re.split('([0-9]+)', s)]
+
+
+def pack_path(pack_dir, emotion):
+    """Path of the pack for an emotion"""
+    return os.path.join(pack_dir, emotion + EXTENSION)
+
+
+def compile_pack(frame_paths, out_path, fps, rotation=0, name=''):
+    """
+    Compile PNG frames into a pack.
+
+    Frames are decoded and converted one at a time, so memory use does not
+    grow with the length of the animation. The pack is written to a
+    temporary file and renamed into place.
+
+    Args:
+        frame_paths: Frame images in playback order
+        out_path: Pack file to write
+        fps: Playback rate stored as each frame's duration
+        rotation: Degrees to rotate each frame by before converting, recorded
+                  in the header as the pack's baked rotation
+        name: Name stored in the header, usually the emotion
+
+    Returns:
+        Number of frames written
+    """
+    if not frame_paths:
+        raise ValueError(f"No frames to pack into {out_path}")
+    count = len(frame_paths)
+    first = Image.open(frame_paths[0])
+    width, height = first.rotate(rotation).size if rotation else first.size
+    converter = rgb565.RGB565Converter(width, height)
+    frame_bytes = width * height * 2
+
+    index_offset = _HEADER.size
+    data_offset = index_offset + count * _INDEX.itemsize
+    data_offset += -data_offset % PAGE_SIZE
+    index = np.zeros(count, dtype=_INDEX)
+    index['offset'] = data_offset + np.arange(count, dtype=np.uint64) * frame_bytes
+    index['nbytes'] = frame_bytes
+    index['duration_us'] = round(1e6 / fps)
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, width, height, rotation, count, fps,
+                             index_offset, data_offset, name.encode()[:32]))
+        f.write(index.tobytes())
+        f.write(b'\0' * (data_offset - f.tell()))
+        for path in frame_paths:
+            image = Image.open(path)
+            if rotation:
+                image = image.rotate(rotation)
+            f.write(converter.convert(image).tobytes())
+    os.replace(tmp_path, out_path)
+    return count
+
+
+class FramePack:
+    """
+    A compiled pack, memory-mapped for playback.
+
+    Behaves like a read-only sequence of (height, width, 2) RGB565 frames.
+    The frames are views into the mapping: nothing is read or copied until
+    a frame is sent, and the frames must not be used after close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+        if hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+    def _parse(self):
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f"{self.path} is not a frame pack")
+        (magic, version, self.width, self.height, self.rotation, count, self.fps,
+         index_offset, data_offset, name) = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a frame pack")
+        if version != VERSION:
+            raise ValueError(f"{self.path} has pack version {version}, expected {VERSION}")
+        self.name = name.rstrip(b'\0').decode()
+
+        self.index = np.frombuffer(self._mmap, dtype=_INDEX, count=count, offset=index_offset)
+        frame_bytes = self.width * self.height * 2
+        if count and (np.any(self.index['nbytes'] != frame_bytes)
+                      or int(self.index['offset'].max()) + frame_bytes > len(self._mmap)):
+            raise ValueError(f"{self.path} is truncated or corrupt")
+        self.durations = self.index['duration_us'] / 1e6
+        shape = (self.height, self.width, 2)
+        self._frames = [
+            np.frombuffer(self._mmap, dtype=np.uint8, count=frame_bytes, offset=int(offset)).reshape(shape)
+            for offset in self.index['offset']
+        ]
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, i):
+        return self._frames[i]
+
+    def __iter__(self):
+        return iter(self._frames)
+
+    def nbytes(self):
+        """Size of the frame data"""
+        return len(self) * self.width * self.height * 2
+
+    def close(self):
+        """Unmap the pack; frames handed out earlier become invalid"""
+        self._frames = []
+        self.index = None
+        self.durations = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Frames are still referenced elsewhere; the mapping goes
+                # away with the last of them
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return (f"FramePack({self.name!r}, {len(self)} frames, "
+                f"{self.width}x{self.height}, {self.fps:g} fps)")
+
+
+def emotion_frame_paths(src_dir, emotion):
+    """Frame files of an emotion directory in playback order"""
+    return sorted(glob.glob(os.path.join(src_dir, emotion, 'frame*.png')), key=natural_sort_key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile emotion frame directories into frame packs")
+    parser.add_argument('emotions', nargs='*',
+                        help="emotions to compile (default: every emotion the player knows)")
+    parser.add_argument('--src', default=BASE_DIR, help="directory holding the emotion directories")
+    parser.add_argument('--out', default=os.path.join(BASE_DIR, 'packs'), help="directory to write the packs to")
+    parser.add_argument('--fps', type=float, help="frame rate for every pack (default: the player's emotion_speeds)")
+    parser.add_argument('--rotate', type=int, default=0,
+                        help="degrees to bake into the frames (default: 0, the panel rotates them)")
+    args = parser.parse_args(argv)
+
+    speeds = {}
+    if args.fps is None or not args.emotions:
+        speeds = EMOTION_SPEEDS
+    emotions = args.emotions or list(speeds)
+
+    for emotion in emotions:
+        fps = args.fps or speeds.get(emotion)
+        if not fps:
+            parser.error(f"No frame rate known for {emotion}, pass --fps")
+        frames = emotion_frame_paths(args.src, emotion)
+        if not frames:
+            logging.warning(f"No frames found for {emotion}, skipped")
+            continue
+        out_path = pack_path(args.out, emotion)
+        count = compile_pack(frames, out_path, fps, args.rotate, emotion)
+        logging.info(f"Packed {count} frames of {emotion} into {out_path} "
+                     f"({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,338 @@
+"""
+Headless stand-in for the LCD hardware: spidev, gpiozero and RPi.GPIO.
+
+A Simulator is a GPIO backend for lcdconfig.RaspberryPi that also opens
+SPI devices, so a driver built on it runs unchanged on any machine:
+
+    disp = LCD_2inch.LCD_2inch(gpio='sim')    # or LCD_BACKEND=sim in the environment
+    disp.Init()
+    disp.ShowImage(image)
+    disp.gpio.image().save('screen.png')
+
+It decodes the MIPI DCS commands the drivers send (CASET, RASET, RAMWR,
+MADCTL, resets) into a virtual RAM, records every command with its
+parameters, and adds up the time the bus would have been busy at the
+configured SPI clock. With realtime=True (LCD_SIM_REALTIME=1) it also
+sleeps for that long, so playback runs at the speed the real bus allows.
+
+Colour order (MADCTL BGR) and display inversion are not modelled: the
+framebuffer holds the RGB565 values as they were sent.
+"""
+import time
+import logging
+from collections import deque
+
+import numpy as np
+
+# DCS commands the simulator acts on
+SWRESET = 0x01
+SLPIN = 0x10
+SLPOUT = 0x11
+DISPOFF = 0x28
+DISPON = 0x29
+CASET = 0x2A
+RASET = 0x2B
+RAMWR = 0x2C
+MADCTL = 0x36
+
+_MADCTL_MY = 0x80
+_MADCTL_MX = 0x40
+_MADCTL_MV = 0x20
+
+
+class SimPin:
+    """Simulated output or input pin with the gpiozero device interface"""
+
+    def __init__(self, sim, pin):
+        self._sim = sim
+        self.pin = pin
+        self.value = 0
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+    def _set(self, value):
+        self._sim.pin_write(self.pin, value)
+        self.value = value
+
+    def close(self):
+        pass
+
+
+class SimPWM:
+    """Simulated PWM output (backlight)"""
+
+    def __init__(self, sim, pin, frequency):
+        self._sim = sim
+        self.pin = pin
+        self.value = 0
+        self.frequency = frequency
+
+    def close(self):
+        self.value = 0
+
+
+class SimSpi:
+    """spidev.SpiDev stand-in feeding the simulator"""
+
+    def __init__(self, sim, bus=0, device=0, bufsiz=4096):
+        self._sim = sim
+        self.bus = bus
+        self.device = device
+        self.bufsiz = bufsiz
+        self.max_speed_hz = 125000000
+        self.mode = 0
+
+    def writebytes(self, values):
+        if len(values) > self.bufsiz:
+            raise OverflowError("writebytes is limited to %d bytes" % self.bufsiz)
+        self._sim.spi_write(self, bytes(v & 0xff for v in values))
+
+    def writebytes2(self, values):
+        if isinstance(values, list):
+            data = bytes(v & 0xff for v in values)
+        else:
+            data = memoryview(values).cast('B')
+        self._sim.spi_write(self, data)
+
+    def xfer2(self, values):
+        self.writebytes(values)
+        return [0] * len(values)
+
+    def close(self):
+        pass
+
+
+class Simulator:
+    """
+    Virtual LCD controller, usable as an lcdconfig GPIO backend.
+
+    Args:
+        ram_width, ram_height: Controller RAM in its native orientation
+                               (240x320 for the ST7789 behind LCD_2inch)
+        visible: (x, y, width, height) of the RAM the panel shows; all of it by default
+        realtime: Sleep for the modelled bus time of every transfer
+        keep_data: Keep the pixel bytes of RAMWR in the command log, not just their count
+        log_size: Number of commands kept in the log, oldest dropped first
+        transfer_overhead: Seconds per spidev ioctl (one per bufsiz chunk)
+        pin_write_time: Seconds per GPIO write
+        rst, dc, bl: Pins wired to the controller; lcdconfig sets them
+                     from its own arguments
+    """
+    name = 'sim'
+
+    def __init__(self, ram_width=240, ram_height=320, visible=None, realtime=False,
+                 keep_data=False, log_size=100000, transfer_overhead=20e-6,
+                 pin_write_time=2e-6, rst=27, dc=25, bl=18):
+        self.ram_width = ram_width
+        self.ram_height = ram_height
+        self.visible = tuple(visible) if visible is not None else (0, 0, ram_width, ram_height)
+        self.realtime = realtime
+        self.keep_data = keep_data
+        self.log_size = log_size
+        self.transfer_overhead = transfer_overhead
+        self.pin_write_time = pin_write_time
+        self.attach(rst=rst, dc=dc, bl=bl)
+
+        self.ram = np.zeros((ram_height, ram_width), dtype=np.uint16)
+        self.pins = {}
+        self.backlight = None
+        self.reset_counters()
+        self.hardware_reset()
+
+    def attach(self, rst=None, dc=None, bl=None):
+        """Set which pins drive the controller's RST and DC lines and the backlight"""
+        if rst is not None:
+            self.rst = rst
+        if dc is not None:
+            self.dc = dc
+        if bl is not None:
+            self.bl = bl
+
+    # GPIO backend interface
+
+    def output(self, pin):
+        self.pins[pin] = SimPin(self, pin)
+        return self.pins[pin]
+
+    def input(self, pin, pull_up=None, active_state=True):
+        self.pins[pin] = SimPin(self, pin)
+        return self.pins[pin]
+
+    def pwm(self, pin, frequency):
+        self.backlight = SimPWM(self, pin, frequency)
+        return self.backlight
+
+    def spi(self, bus=0, device=0):
+        return SimSpi(self, bus, device)
+
+    # Controller model
+
+    def reset_counters(self):
+        """Clear the command log and the bus counters"""
+        self.log = deque(maxlen=self.log_size)
+        self.bus_time = 0.0
+        self.bytes_written = 0
+        self.transfers = 0
+        self.pin_writes = 0
+        self.pixels_written = 0
+
+    def hardware_reset(self):
+        """Registers back to their power-on values; RAM keeps its contents"""
+        self.madctl = 0
+        self.window = (0, 0, self.ram_width - 1, self.ram_height - 1)
+        self.sleeping = True
+        self.display_on = False
+        self._cmd = None
+        self._params = bytearray()
+        self._ram_pos = 0
+        self._odd_byte = None
+
+    def _spend(self, seconds):
+        self.bus_time += seconds
+        if self.realtime:
+            time.sleep(seconds)
+
+    def pin_write(self, pin, value):
+        self.pin_writes += 1
+        self._spend(self.pin_write_time)
+        previous = self.pins[pin].value if pin in self.pins else 0
+        if pin == self.rst and previous and not value:
+            self.hardware_reset()
+
+    def _dc(self):
+        pin = self.pins.get(self.dc)
+        return pin is not None and pin.value
+
+    def spi_write(self, spi, data):
+        """One spidev call: costs the bits at the bus clock plus the per-ioctl overhead"""
+        n = len(data)
+        chunks = max(1, -(-n // spi.bufsiz))
+        self.transfers += chunks
+        self.bytes_written += n
+        self._spend(n * 8.0 / spi.max_speed_hz + chunks * self.transfer_overhead)
+        if not n:
+            return
+        if self._dc():
+            self._data(data)
+        else:
+            for cmd in bytes(data):
+                self._command(cmd)
+
+    def _command(self, cmd):
+        self._cmd = cmd
+        self._params = bytearray()
+        self.log.append((cmd, b''))
+        if cmd == SWRESET:
+            self.hardware_reset()
+        elif cmd == SLPIN:
+            self.sleeping = True
+        elif cmd == SLPOUT:
+            self.sleeping = False
+        elif cmd == DISPOFF:
+            self.display_on = False
+        elif cmd == DISPON:
+            self.display_on = True
+        elif cmd == RAMWR:
+            self._ram_pos = 0
+            self._odd_byte = None
+
+    def _data(self, data):
+        cmd = self._cmd
+        if cmd is None:
+            logging.debug("LCD simulator: %d data bytes without a command", len(data))
+            return
+        if cmd == RAMWR:
+            self._ram_write(data)
+            if self.keep_data:
+                self.log[-1] = (cmd, self.log[-1][1] + bytes(data))
+            return
+        self._params += bytes(data)
+        self.log[-1] = (cmd, bytes(self._params))
+        params = self._params
+        if cmd == CASET and len(params) == 4:
+            self.window = ((params[0] << 8) | params[1], self.window[1],
+                           (params[2] << 8) | params[3], self.window[3])
+        elif cmd == RASET and len(params) == 4:
+            self.window = (self.window[0], (params[0] << 8) | params[1],
+                           self.window[2], (params[2] << 8) | params[3])
+        elif cmd == MADCTL and len(params) == 1:
+            self.madctl = params[0]
+
+    def _ram_write(self, data):
+        buf = np.frombuffer(data, dtype=np.uint8)
+        if self._odd_byte is not None:
+            buf = np.concatenate(([self._odd_byte], buf))
+            self._odd_byte = None
+        if len(buf) % 2:
+            self._odd_byte = buf[-1]
+            buf = buf[:-1]
+        if not len(buf):
+            return
+        words = (buf[0::2].astype(np.uint16) << 8) | buf[1::2]
+
+        x0, y0, x1, y1 = self.window
+        cols, rows = x1 - x0 + 1, y1 - y0 + 1
+        if cols <= 0 or rows <= 0:
+            return
+        index = (self._ram_pos + np.arange(len(words))) % (cols * rows)
+        self._ram_pos = (self._ram_pos + len(words)) % (cols * rows)
+        x = x0 + index % cols
+        y = y0 + index // cols
+
+        # Window coordinates to RAM: exchange, then mirror columns and rows
+        if self.madctl & _MADCTL_MV:
+            x, y = y, x
+        if self.madctl & _MADCTL_MX:
+            x = self.ram_width - 1 - x
+        if self.madctl & _MADCTL_MY:
+            y = self.ram_height - 1 - y
+        inside = (x >= 0) & (x < self.ram_width) & (y >= 0) & (y < self.ram_height)
+        if not inside.all():
+            x, y, words = x[inside], y[inside], words[inside]
+        self.ram[y, x] = words
+        self.pixels_written += len(words)
+
+    # Inspection
+
+    def framebuffer(self):
+        """Visible part of the RAM as (h, w) uint16 RGB565 words"""
+        x, y, w, h = self.visible
+        return self.ram[y:y + h, x:x + w]
+
+    def image(self):
+        """Visible part of the RAM as a PIL RGB image, in the panel's native orientation"""
+        from PIL import Image
+        words = self.framebuffer()
+        rgb = np.empty(words.shape + (3,), dtype=np.uint8)
+        r = (words >> 11) & 0x1F
+        g = (words >> 5) & 0x3F
+        b = words & 0x1F
+        rgb[..., 0] = (r << 3) | (r >> 2)
+        rgb[..., 1] = (g << 2) | (g >> 4)
+        rgb[..., 2] = (b << 3) | (b >> 2)
+        return Image.fromarray(rgb)
+
+    def save(self, path):
+        """Write the visible framebuffer to an image file"""
+        self.image().save(path)
+
+    def commands(self, cmd=None):
+        """Logged (command, parameters) pairs, optionally only one command"""
+        if cmd is None:
+            return list(self.log)
+        return [entry for entry in self.log if entry[0] == cmd]
+
+    def stats(self):
+        """Bus counters as a dict"""
+        return {
+            'bus_time_s': round(self.bus_time, 6),
+            'bytes_written': self.bytes_written,
+            'transfers': self.transfers,
+            'pin_writes': self.pin_writes,
+            'pixels_written': self.pixels_written,
+            'commands': len(self.log),
+        }
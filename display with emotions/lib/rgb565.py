@@ -0,0 +1,112 @@
+"""
+RGB888 -> RGB565 conversion shared by the LCD_* drivers.
+
+The panels take one big-endian 16-bit word per pixel:
+
+    RRRRRGGG GGGBBBBB
+
+The converter keeps its scratch planes and output buffer between calls,
+so converting a frame allocates nothing. Channels are first copied into
+contiguous planes, then packed as uint16 in place and byte-swapped to
+the panel's byte order.
+"""
+import sys
+
+import numpy as np
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def image_size(image):
+    """Return (width, height) of a PIL image or an (h, w, 3|4) array"""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+
+def as_rgb_array(image):
+    """Return an (h, w, 3) uint8 view of a PIL image or an RGB/RGBA array"""
+    if not isinstance(image, np.ndarray):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image = np.asarray(image)
+    if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] not in (3, 4):
+        raise ValueError('Expected an RGB888 image, got array of shape {0} and dtype {1}'
+                         .format(image.shape, image.dtype))
+    return image[..., :3]
+
+
+class RGB565Converter:
+    """Convert RGB888 frames of one size into panel-ready RGB565 buffers"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._planes = np.empty((3, height, width), dtype=np.uint8)
+        self._scratch = np.empty((height, width), dtype=np.uint16)
+        self._out = self.new_buffer()
+
+    def new_buffer(self, count=None):
+        """Allocate an output buffer: (h, w, 2), or (count, h, w, 2) for batches"""
+        shape = (self.height, self.width, 2)
+        if count is not None:
+            shape = (count,) + shape
+        return np.empty(shape, dtype=np.uint8)
+
+    def convert(self, image, out=None):
+        """
+        Convert one frame.
+
+        Args:
+            image: PIL image or (h, w, 3|4) uint8 array
+            out: optional (h, w, 2) uint8 buffer to write into. Without it
+                 the converter's own buffer is reused, so the result is only
+                 valid until the next call.
+
+        Returns:
+            (h, w, 2) uint8 array holding big-endian RGB565 pixels
+        """
+        width, height = image_size(image)
+        if width != self.width or height != self.height:
+            raise ValueError('Image must be same dimensions as converter \
+                ({0}x{1}).' .format(self.width, self.height))
+        if out is None:
+            out = self._out
+        words = out.view(np.uint16).reshape(self.height, self.width)
+        scratch = self._scratch
+
+        np.copyto(self._planes, as_rgb_array(image).transpose(2, 0, 1))
+        r, g, b = self._planes
+        np.bitwise_and(r, 0xF8, out=r)
+        np.left_shift(r, 8, out=words, dtype=np.uint16)
+        np.bitwise_and(g, 0xFC, out=g)
+        np.left_shift(g, 3, out=scratch, dtype=np.uint16)
+        np.bitwise_or(words, scratch, out=words)
+        np.right_shift(b, 3, out=b)
+        np.bitwise_or(words, b, out=words, dtype=np.uint16)
+        if _LITTLE_ENDIAN:
+            words.byteswap(inplace=True)
+        return out
+
+    def convert_batch(self, frames, out=None):
+        """
+        Convert a whole frame sequence.
+
+        Args:
+            frames: sequence of PIL images, or an (n, h, w, 3|4) uint8 array
+            out: optional (n, h, w, 2) uint8 buffer
+
+        Returns:
+            (n, h, w, 2) uint8 array, one RGB565 frame per input frame
+        """
+        if out is None:
+            out = self.new_buffer(len(frames))
+        for i, frame in enumerate(frames):
+            self.convert(frame, out[i])
+        return out
+
+
+def to_rgb565(image, out=None):
+    """Convert a single frame with a throwaway converter"""
+    width, height = image_size(image)
+    return RGB565Converter(width, height).convert(image, out)
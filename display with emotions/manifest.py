@@ -0,0 +1,187 @@
+#display with emotions/manifest.py
+"""
+Asset manifest: the frame lists of every emotion, generated once.
+
+Without it the player globs 13 emotion directories relative to the
+current directory, natural-sorts every listing and stats every frame
+file before showing anything. The manifest records, per emotion, the
+frame files in playback order, their sizes, modification times and
+content ids (frame_store.frame_hash), the frame size and the frame
+rate, so boot reads one file. Paths are relative to the manifest, which
+lives next to the player, so it runs from any directory.
+
+The files are checked against the manifest later, off the boot path
+(Manifest.validate): a missing file or a size change marks an emotion
+stale, and a file whose modification time changed is hashed again and
+compared with its recorded id.
+
+Generate it from the "display with emotions" directory, and again after
+changing frames or emotion_speeds:
+
+    python manifest.py
+    python manifest.py happy sad          # only update these emotions
+"""
+import os
+import json
+import logging
+import argparse
+
+from PIL import Image
+
+from framepack import emotion_frame_paths
+from emotions import EMOTION_SPEEDS
+from frame_store import FrameStore, frame_hash
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE = 'manifest.json'
+VERSION = 1
+
+
+def manifest_entry(base_dir, emotion, fps, store=None):
+    """
+    Manifest entry of an emotion directory, or None if it holds no frames.
+
+    Args:
+        base_dir: Directory holding the emotion directories
+        emotion: Emotion directory name
+        fps: Frame rate to record
+        store: FrameStore to take frame ids from, or None to hash every frame
+    """
+    paths = emotion_frame_paths(base_dir, emotion)
+    if not paths:
+        return None
+    stats = [os.stat(path) for path in paths]
+    width, height = Image.open(paths[0]).size
+    return {
+        'fps': fps,
+        'width': width,
+        'height': height,
+        'count': len(paths),
+        'files': [os.path.relpath(path, base_dir).replace(os.sep, '/') for path in paths],
+        'sizes': [st.st_size for st in stats],
+        'mtimes': [st.st_mtime_ns for st in stats],
+        'ids': [store.frame_id(path) if store else frame_hash(path) for path in paths],
+    }
+
+
+def write_manifest(emotions, path):
+    """Write {emotion: entry} as a manifest, through a temporary file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': VERSION, 'emotions': emotions}, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    """
+    A loaded manifest.
+
+    Args:
+        path: Manifest file; frame paths are resolved against its directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"{path} is manifest version {data.get('version')}, expected {VERSION}")
+        self.emotions = data['emotions']
+        self.stale = set()
+
+    @classmethod
+    def load(cls, path):
+        """The manifest at path, or None if it is missing or unreadable"""
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring manifest {path}: {e}")
+            return None
+
+    def __contains__(self, emotion):
+        return emotion in self.emotions
+
+    def frame_paths(self, emotion):
+        """Frame files of an emotion in playback order"""
+        return [os.path.join(self.base_dir, name) for name in self.emotions[emotion]['files']]
+
+    def frame_ids(self, emotion):
+        """Content ids of an emotion's frames, as frame_store.FrameStore gives them"""
+        return list(self.emotions[emotion]['ids'])
+
+    def fps(self, emotion):
+        return self.emotions[emotion]['fps']
+
+    def size(self, emotion):
+        """(width, height) of an emotion's frames"""
+        entry = self.emotions[emotion]
+        return entry['width'], entry['height']
+
+    def newest(self, emotion):
+        """Modification time in seconds of an emotion's newest frame, as recorded"""
+        return max(self.emotions[emotion]['mtimes']) / 1e9
+
+    def validate(self, emotion, store=None):
+        """
+        Check an emotion's frame files against the manifest.
+
+        Args:
+            store: FrameStore to hash changed files with, or None to hash them directly
+
+        Returns:
+            True if the files are the ones recorded; otherwise the emotion
+            is added to self.stale
+        """
+        entry = self.emotions[emotion]
+        paths = self.frame_paths(emotion)
+        ok = paths == emotion_frame_paths(self.base_dir, emotion)
+        for path, size, mtime, fid in zip(paths, entry['sizes'], entry['mtimes'], entry['ids']):
+            if not ok:
+                break
+            try:
+                st = os.stat(path)
+                ok = st.st_size == size and (st.st_mtime_ns == mtime
+                                             or (store.frame_id(path) if store else frame_hash(path)) == fid)
+            except OSError:
+                ok = False
+        if not ok:
+            self.stale.add(emotion)
+        return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the asset manifest the player boots from")
+    parser.add_argument('emotions', nargs='*',
+                        help="emotions to (re)generate (default: every emotion the player knows)")
+    parser.add_argument('--out', default=os.path.join(BASE_DIR, MANIFEST_FILE), help="manifest to write")
+    parser.add_argument('--index', default=os.path.join(BASE_DIR, 'frame_store.json'),
+                        help="frame id index to reuse hashes from (see frame_store.py)")
+    args = parser.parse_args(argv)
+
+    base_dir = os.path.dirname(os.path.abspath(args.out))
+    emotions = {}
+    existing = Manifest.load(args.out) if args.emotions else None
+    if existing is not None:
+        emotions = existing.emotions
+    store = FrameStore(args.index)
+    for emotion in args.emotions or list(EMOTION_SPEEDS):
+        if emotion not in EMOTION_SPEEDS:
+            parser.error(f"Unknown emotion {emotion}")
+        entry = manifest_entry(base_dir, emotion, EMOTION_SPEEDS[emotion], store)
+        if entry is None:
+            logging.warning(f"No frames found for {emotion}, left out")
+            emotions.pop(emotion, None)
+            continue
+        emotions[emotion] = entry
+        logging.info(f"{emotion}: {entry['count']} frames, {entry['width']}x{entry['height']}, {entry['fps']} fps")
+    store.save()
+    write_manifest(emotions, args.out)
+    logging.info(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -4,20 +4,41 @@ import sys
 import time
 import logging
 import threading
-import glob
-import re
 import signal
-from queue import Queue
-import spidev as SPI
-from PIL import Image
+from queue import Queue, Empty
+
+# When the player started, before the heavy imports below, for the startup
+# timings in the log
+STARTED = time.monotonic()
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
 
 # Add path for LCD library
 sys.path.append("..")
-from lib import LCD_2inch
+from lib import LCD_2inch, rgb565, dirtyrect  # noqa: E402
+from display_writer import DisplayWriter  # noqa: E402
+from display_group import DisplayGroup, EYES  # noqa: E402
+import deltapack  # noqa: E402
+from framepack import FramePack, pack_path, emotion_frame_paths  # noqa: E402
+from deltapack import DeltaPack  # noqa: E402
+from scheduler import FrameScheduler  # noqa: E402
+from frame_cache import FrameCache  # noqa: E402
+from prefetch import Prefetcher  # noqa: E402
+from frame_store import FrameStore  # noqa: E402
+from transitions import Transitions  # noqa: E402
+from telemetry import Telemetry  # noqa: E402
+from profiler import Profiler  # noqa: E402
+from command_server import CommandServer  # noqa: E402
+from manifest import Manifest, MANIFEST_FILE  # noqa: E402
+from emotions import EMOTION_SPEEDS, EMOTIONS  # noqa: E402
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Frames, packs and the manifest are found next to this file, whatever the current directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class RobotEmotionsLCD:
     def __init__(self):
         # LCD configuration - from test.py
@@ -26,11 +47,44 @@ class RobotEmotionsLCD:
         self.BL = 18
         self.bus = 0
         self.device = 0
+        self.partial_refresh = False  # Only resend changed regions of each frame
+        self.rotation = 180  # Display rotation, applied by the LCD controller (0 or 180)
+        self.frame_buffers = 3  # Reusable frame buffers for the display writer
+        self.frame_policy = 'block'  # When buffers run out: 'block' or 'drop_oldest'
+        # Panels driven together (see display_group.py), or None for one LCD;
+        # LCD_PANELS=eyes drives the two-eye wiring
+        self.panels = EYES if os.environ.get('LCD_PANELS') == 'eyes' else None
+        self.frame_cache_budget = 32 * 1024 * 1024  # Bytes of converted frames kept in memory
+        self.prefetch_frames = 8  # Leading frames of likely next emotions decoded ahead
         
         # Core state management - from file.py
         self.current_state = None
         self.command_queue = Queue()
         self.running = True
+        # Set when a command is queued or the robot shuts down; playback
+        # and the idle loop wait on it instead of polling the queue
+        self.command_event = threading.Event()
+        # Also take commands on a UNIX socket path or localhost port (see command_server.py);
+        # LCD_COMMAND_REMOTE=1 allows a TCP address off loopback
+        self.command_socket = os.environ.get('LCD_COMMAND_SOCKET')
+        self.command_remote = os.environ.get('LCD_COMMAND_REMOTE') == '1'
+        self.command_server = None
+
+        # Frame timing histograms (see telemetry.py), served on
+        # localhost:LCD_METRICS_PORT and/or written to LCD_METRICS_FILE
+        self.telemetry = Telemetry()
+        self.telemetry.add_collector(self.collect_metrics)
+        self.metrics_port = int(os.environ.get('LCD_METRICS_PORT', 0)) or None
+        self.metrics_file = os.environ.get('LCD_METRICS_FILE')
+        self.command_time = None  # when the last command arrived, until its first frame
+
+        # cProfile and tracemalloc captures on demand (see profiler.py): from
+        # boot for LCD_PROFILE seconds, on SIGUSR1 or on a 'profile' command
+        self.profiler = Profiler(self, os.environ.get('LCD_PROFILE_DIR') or os.path.join(BASE_DIR, 'profiles'))
+        self.profile_seconds = float(os.environ.get('LCD_PROFILE', 0)) or None
+
+        # Paces frames on absolute deadlines, dropping frames when behind
+        self.scheduler = FrameScheduler(wait=self.wait_for_command, telemetry=self.telemetry)
         
         # Dictionary to store frame paths for each emotion
         self.emotion_frames = {
@@ -40,125 +94,566 @@ class RobotEmotionsLCD:
         }
 
         # Frame rates for each emotion (fps)
-        self.emotion_speeds = {
-            'bootup': 20, 'bootup3': 20, 'neutral': 20, 'angry': 60,
-            'blink': 40, 'blink2': 40, 'dizzy': 90, 'excited': 10,
-            'happy': 20, 'happy2': 20, 'happy3': 20, 'sad': 20, 'sleep': 15
-        }
+        self.emotion_speeds = dict(EMOTION_SPEEDS)
+
+        # Precompiled frame packs (see framepack.py) or delta packs (see
+        # deltapack.py), used instead of the PNG frames when present
+        self.frame_pack_dir = os.path.join(BASE_DIR, 'packs')
+        self.frame_packs = {}
+
+        # Frame ids by content (see frame_store.py, or the manifest): a picture shown by
+        # several frames or emotions is converted and cached once
+        self.frame_store = FrameStore(os.path.join(BASE_DIR, 'frame_store.json'))
+        self.frame_ids = {}
+
+        # Frame lists, ids and rates generated ahead (see manifest.py);
+        # without one the emotion directories are scanned at boot
+        self.manifest_path = os.path.join(BASE_DIR, MANIFEST_FILE)
+        self.manifest = None
+
+        # Bootup is loaded first and the other emotions in the background
+        # (see setup); frames_changed is notified as each emotion is added to
+        # loaded_emotions, and frames_loaded is set once every emotion is
+        self.loaded_emotions = set()
+        self.unhashed = set()  # emotions whose frame ids wait for the asset loader
+        self.frames_changed = threading.Condition()
+        self.frames_loaded = threading.Event()
+
+        # Id of the frame on the panel; a frame with the same id is not sent
+        # again. Frames skipped and bus time saved are counted per emotion.
+        self.on_screen = None
+        self.skipped = {}
+
+        # Converted PNG frames of the emotions that fit (see frame_cache.py)
+        self.frame_cache = FrameCache(self.frame_cache_budget)
+        self._converters = threading.local()
+
+        # Decodes the opening frames of the likely next emotions (see prefetch.py)
+        self.prefetcher = Prefetcher(self.frame_cache, self.load_frame, self.prefetch_frames,
+                                     key=self.frame_key)
         
         # Speed settings
-        self.transition_speed = 60  # Speed for transitioning from neutral (fps)
+        self.transition_speed = 60  # Speed of transition clips (fps)
+
+        # Short clips between neutral and the emotions (see transitions.py)
+        self.transitions = Transitions(self)
+        self.neutral_index = 0  # neutral frame on screen, where clips start
         
         # Initialize signal handler and load frames
         signal.signal(signal.SIGINT, self.signal_handler)
+        self.profiler.install_signal()
     
     def initialize_lcd(self):
         """Initialize the LCD display"""
         try:
+            if self.panels:
+                # Frames are converted once and queued to every panel's writer
+                self.group = DisplayGroup(self.panels, LCD_2inch.LCD_2inch, self.frame_buffers,
+                                          self.frame_policy, self.partial_refresh, self.rotation,
+                                          self.telemetry)
+                self.group.open(brightness=50)
+                self.disp = self.group.displays[0]
+                self.writer = self.group
+                logging.info("LCD initialized successfully")
+                return True
             self.disp = LCD_2inch.LCD_2inch()
             self.disp.Init()
+            self.disp.partial_update = self.partial_refresh
+            self.disp.set_orientation(rotation=self.rotation)
             self.disp.clear()
             self.disp.bl_DutyCycle(50)  # Set backlight brightness to 50%
+            self.writer = DisplayWriter(self.disp, self.frame_buffers, self.frame_policy,
+                                        telemetry=self.telemetry)
+            self.writer.start()
             logging.info("LCD initialized successfully")
             return True
         except Exception as e:
             logging.error(f"Failed to initialize LCD: {e}")
             return False
     
-    def natural_sort_key(self, s):
-        """
-        Generate a key for natural sorting of strings containing numbers.
-        Ensures "frame2.png" comes before "frame10.png"
-        """
-        return [int(text) if text.isdigit() else text.lower()
-                for text in re.split('([0-9]+)', s)]
+    def load_manifest(self):
+        """Read the asset manifest, if there is one (see manifest.py)"""
+        self.manifest = Manifest.load(self.manifest_path)
+        if self.manifest is None:
+            logging.info(f"No manifest at {self.manifest_path}, scanning the frame directories; "
+                         "run python manifest.py to boot faster")
 
-    def load_sorted_frames(self):
+    def load_sorted_frames(self, emotions=None, hash_frames=True):
         """
-        Load and sort frames for each emotion based on frame number.
-        Uses natural sorting to ensure correct frame sequence.
+        Load the frame lists of emotions, every emotion by default.
+
+        They come from the manifest when there is one, so boot reads a
+        single file; the frame files are checked against it later by
+        validate_frames. Without a manifest each emotion directory is
+        listed, naturally sorted and hashed into the frame store.
+
+        Args:
+            hash_frames: Hash frames missing from the frame store now; if
+                         False their frames go by (emotion, index) until
+                         hash_deferred_frames runs
         """
-        for emotion in self.emotion_frames:
-            # Get and sort all PNG files in the emotion directory
+        for emotion in emotions or list(self.emotion_frames):
             try:
-                frames = sorted(glob.glob(f"{emotion}/frame*.png"), key=self.natural_sort_key)
+                ids = newest = None
+                if self.manifest is not None and emotion in self.manifest:
+                    frames = self.manifest.frame_paths(emotion)
+                    ids = self.manifest.frame_ids(emotion)
+                    newest = self.manifest.newest(emotion)
+                    self.emotion_speeds[emotion] = self.manifest.fps(emotion)
+                else:
+                    frames = emotion_frame_paths(BASE_DIR, emotion)
+                pack = self.load_frame_pack(emotion, frames, newest)
+                if pack is not None:
+                    self.frame_packs[emotion] = pack
+                    frames = pack
+                    if ids is None and isinstance(pack, DeltaPack):
+                        # Deltas with no changed tiles repeat the frame before
+                        starts = np.maximum.accumulate(np.where(pack.repeats(), 0, np.arange(len(pack))))
+                        ids = [(emotion, int(start)) for start in starts]
+                    if ids:
+                        self.frame_ids[emotion] = ids
+                elif ids or hash_frames:
+                    self.frame_ids[emotion] = ids or self.frame_store.add_sequence(emotion, frames)
+                else:
+                    self.unhashed.add(emotion)
                 self.emotion_frames[emotion] = frames
-                logging.info(f"Loaded {len(frames)} frames for {emotion}")
+                logging.info(f"Loaded {len(frames)} frames for {emotion}"
+                             + (f" from {os.path.basename(pack.path)}" if pack is not None else ""))
             except Exception as e:
                 logging.error(f"Error loading frames for {emotion}: {e}")
                 self.emotion_frames[emotion] = []
+            with self.frames_changed:
+                self.loaded_emotions.add(emotion)
+                self.frames_changed.notify_all()
+        self.save_frame_store()
+
+    def load_assets(self):
+        """
+        Load every emotion not loaded yet, then hash the frames missing
+        from the frame store and check the frames against the manifest.
+        Runs in the background from setup; the player is interactive once
+        the frame lists are loaded, before the hashing.
+        """
+        try:
+            self.load_sorted_frames([e for e in self.emotion_frames if e not in self.loaded_emotions],
+                                    hash_frames=False)
+        finally:
+            with self.frames_changed:
+                self.frames_loaded.set()
+                self.frames_changed.notify_all()
+        logging.info(f"Interactive after {(time.monotonic() - STARTED) * 1000:.0f} ms: "
+                     f"frames of {len(self.loaded_emotions)} emotions loaded")
+        self.transitions.plan_ahead(EMOTIONS)
+        self.hash_deferred_frames()
+        self.validate_frames()
+
+    def hash_deferred_frames(self):
+        """Give the emotions loaded with hash_frames=False their content ids"""
+        for emotion in sorted(self.unhashed):
+            frames = self.emotion_frames[emotion]
+            try:
+                self.frame_ids[emotion] = self.frame_store.add_sequence(emotion, frames)
+            except Exception as e:
+                logging.error(f"Error hashing frames for {emotion}: {e}")
+        self.unhashed.clear()
+        self.save_frame_store()
+
+    def wait_for_frames(self, emotion, timeout=None):
+        """Wait until the frame list of an emotion is loaded; True once it is"""
+        with self.frames_changed:
+            return self.frames_changed.wait_for(
+                lambda: emotion in self.loaded_emotions or self.frames_loaded.is_set(), timeout)
+
+    def save_frame_store(self):
+        """Write the frame store index if frames were hashed"""
+        if self.frame_store.hashed:
+            logging.info(f"Hashed {self.frame_store.hashed} new frames, "
+                         f"{len(self.frame_store.frames)} distinct frames in all")
+            self.frame_store.hashed = 0
+        try:
+            self.frame_store.save()
+        except OSError as e:
+            logging.warning(f"Could not save the frame store index: {e}")
+
+    def validate_frames(self):
+        """
+        Check the frame files against the manifest, one emotion at a time.
+
+        Runs in the background after boot. An emotion whose files changed
+        since the manifest was generated is scanned again and played from
+        what is on disk.
+        """
+        if self.manifest is None:
+            return
+        for emotion in list(self.emotion_frames):
+            if not self.running:
+                return
+            if emotion in self.frame_packs or emotion not in self.manifest:
+                continue
+            try:
+                if self.manifest.validate(emotion, self.frame_store):
+                    continue
+                logging.warning(f"The {emotion} frames changed since {self.manifest_path} was generated, "
+                                "rescanning them; run python manifest.py")
+                frames = emotion_frame_paths(BASE_DIR, emotion)
+                ids = self.frame_store.add_sequence(emotion, frames)
+                # Frames go by position until the new ids are in place
+                self.frame_ids.pop(emotion, None)
+                self.transitions.forget(emotion)
+                self.emotion_frames[emotion] = frames
+                self.frame_ids[emotion] = ids
+            except Exception as e:
+                logging.error(f"Error checking frames for {emotion}: {e}")
+        self.save_frame_store()
+
+    def load_frame_pack(self, emotion, frame_paths, newest=None):
+        """
+        Open the precompiled frame pack of an emotion, if there is a usable one.
+
+        A raw frame pack is preferred, as it needs no decoding at all; a
+        delta pack is used otherwise. A pack is skipped when it no longer matches the frame directory
+        (different frame count, or a frame newer than the pack), does not
+        fit the panel, or has a rotation baked in: the controller rotates
+        frames now. Packs can also be deployed without their PNG directory.
+
+        Args:
+            emotion: Emotion to open the pack of
+            frame_paths: The emotion's frame files
+            newest: Modification time of the newest frame file, from the
+                    manifest; the files are stat'ed when None
+
+        Returns:
+            FramePack, DeltaPack or None
+        """
+        for pack_class, path in ((FramePack, pack_path(self.frame_pack_dir, emotion)),
+                                 (DeltaPack, deltapack.pack_path(self.frame_pack_dir, emotion))):
+            if os.path.exists(path):
+                break
+        else:
+            return None
+        try:
+            pack = pack_class(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring frame pack {path}: {e}")
+            return None
+
+        if frame_paths and newest is None:
+            newest = max(os.path.getmtime(p) for p in frame_paths)
+        stale = frame_paths and (len(pack) != len(frame_paths) or newest > os.path.getmtime(path))
+        if stale or pack.rotation != 0 or (pack.width, pack.height) != (self.disp.height, self.disp.width):
+            logging.warning(f"Frame pack {path} does not match the frames or the display, recompile it")
+            pack.close()
+            return None
+        if pack.fps != self.emotion_speeds[emotion]:
+            logging.info(f"{path} was compiled for {pack.fps:g} fps, "
+                         f"playing at {self.emotion_speeds[emotion]} fps")
+        return pack
+
+    def close_frame_packs(self):
+        """Unmap the frame packs once nothing is being displayed"""
+        for pack in self.frame_packs.values():
+            pack.close()
+        self.frame_packs.clear()
 
     def signal_handler(self, signum, frame):
         """Handle Ctrl+C gracefully"""
         logging.info("\nExiting program...")
-        self.running = False
-        if hasattr(self, 'disp'):
+        self.shutdown()
+        if hasattr(self, 'writer'):
+            self.writer.stop()
+        self.prefetcher.shutdown()
+        self.close_frame_packs()
+        if hasattr(self, 'group'):
+            self.group.close(clear=False)
+        elif hasattr(self, 'disp'):
             try:
                 self.disp.module_exit()
             except:
                 pass
         sys.exit(0)
 
-    def display_frame(self, frame_path):
+    def post_command(self, command):
+        """Queue a command and wake whatever is waiting for one"""
+        if self.profiler.command(command):
+            return
+        self.command_time = time.monotonic()
+        self.command_queue.put(command)
+        self.command_event.set()
+
+    def accept_command(self, command):
+        """Queue a command from stdin or the command server; exit and quit also stop the player"""
+        self.post_command(command)
+        if command in ['exit', 'quit']:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop playback and the main loop"""
+        self.running = False
+        self.command_event.set()
+
+    def wait_for_command(self, timeout=None):
+        """
+        Sleep until a command is queued, the robot shuts down or timeout
+        seconds pass, without using the CPU meanwhile.
+
+        Returns:
+            True if a command is pending or the robot is shutting down
+        """
+        # Clear before looking at the queue, so a command posted in between
+        # sets the event again and the wait returns at once
+        self.command_event.clear()
+        if not self.running or not self.command_queue.empty():
+            return True
+        self.command_event.wait(timeout)
+        return not self.running or not self.command_queue.empty()
+
+    def next_command(self, timeout=None):
+        """
+        Wait for the next command.
+
+        Returns:
+            The command, or None on timeout or shutdown
+        """
+        if not self.wait_for_command(timeout) or not self.running:
+            return None
+        try:
+            return self.command_queue.get_nowait().strip()
+        except Empty:
+            return None
+
+    def load_frame(self, frame_path):
+        """Decode a frame and convert it into a new RGB565 buffer; safe from any thread"""
+        converter = getattr(self._converters, 'converter', None)
+        if converter is None:
+            converter = rgb565.RGB565Converter(self.disp.height, self.disp.width)
+            self._converters.converter = converter
+        image = self.decode_frame(frame_path)
+        converted = time.perf_counter()
+        pix = converter.convert(image, out=converter.new_buffer())
+        self.telemetry.observe('frame_convert_seconds', "RGB565 conversion time per frame",
+                               time.perf_counter() - converted)
+        return pix
+
+    def decode_frame(self, frame_path):
+        """Open and decode a frame image, recording the decode time"""
+        started = time.perf_counter()
+        image = Image.open(frame_path)
+        image.load()
+        self.telemetry.observe('frame_decode_seconds', "Image decode time per frame",
+                               time.perf_counter() - started)
+        return image
+
+    def prefetch_after(self, emotion):
+        """Have the prefetcher decode the opening frames of what may follow emotion"""
+        emotions = ([emotion] if emotion else []) + self.prefetcher.candidates(emotion)
+        self.prefetcher.prefetch(emotions, self.emotion_frames)
+        for candidate in emotions:
+            if candidate in EMOTIONS and self.emotion_frames.get(candidate):
+                self.transitions.prepare(candidate)
+
+    def frame_pixels(self, emotion, index):
+        """RGB565 frame index of an emotion, through the frame cache for PNG frames; safe from any thread"""
+        frames = self.emotion_frames[emotion]
+        if not isinstance(frames, list):
+            return frames[index]
+        key = self.frame_key(emotion, index)
+        pix = self.frame_cache.get(key)
+        if pix is None:
+            pix = self.load_frame(frames[index])
+            self.frame_cache.put(key, pix)
+        return pix
+
+    def frame_key(self, emotion, index):
+        """
+        Frame cache key of a PNG frame: its content id, shared by identical
+        frames, or (emotion, index) while the ids are unknown. The ids may be
+        of a rescanned frame list (validate_frames) while the old one plays.
+        """
+        ids = self.frame_ids.get(emotion)
+        return ids[index] if ids and index < len(ids) else (emotion, index)
+
+    def cache_frames(self, emotion, frames):
+        """Whether frames are PNGs that fit the frame cache; packs need no caching"""
+        if not isinstance(frames, list) or not frames:
+            return False
+        distinct = len(set(self.frame_ids.get(emotion) or frames))
+        return self.frame_cache.admits(distinct * self.disp.width * self.disp.height * 2)
+
+    def display_frame(self, frame_path, key=None):
         """
         Display a frame on the LCD.
-        Loads image, rotates it, and shows it on LCD.
+        Loads image and queues it for the display writer, which sends it
+        while the next frame is being prepared. Frames from a frame pack
+        or a delta pack are already converted and are queued as is. Rotation is done by
+        the LCD controller (see self.rotation).
+
+        Args:
+            frame_path: Frame image path, or an RGB565 frame from a pack
+            key: Frame id to look the converted frame up in the
+                 frame cache with, or None to stream it from disk. Frames
+                 being prefetched are waited for.
         """
         try:
+            if isinstance(frame_path, np.ndarray):
+                self.writer.submit(frame_path)
+                return True
+
+            if key is not None:
+                pix = self.prefetcher.lookup(key)
+                if pix is None:
+                    pix = self.load_frame(frame_path)
+                    self.frame_cache.put(key, pix)
+                self.writer.submit(pix)
+                return True
+
             # Load the image
-            image = Image.open(frame_path)
-            
-            # Rotate the image 180 degrees (as in test.py)
-            image = image.rotate(180)
+            image = self.decode_frame(frame_path)
             
-            # Display the image on the LCD
-            self.disp.ShowImage(image)
+            # Convert and queue the frame; the writer thread sends it
+            self.writer.submit(image)
             return True
         except Exception as e:
-            logging.error(f"Error displaying frame {frame_path}: {e}")
+            logging.error(f"Error displaying frame {frame_path if isinstance(frame_path, str) else 'from pack'}: {e}")
             return False
 
-    def play_frames(self, frames, emotion, is_transition=False):
+    def show_frame(self, emotion, frames, index, cached):
+        """
+        Display frame index of an emotion's frames.
+
+        Args:
+            cached: Whether the emotion goes through the frame cache, see cache_frames
+        """
+        if emotion == 'neutral':
+            self.neutral_index = index
+        # A frame held for several steps is sent once; the panel keeps showing it
+        fid = self.content_id(emotion, index)
+        if self.skip_unchanged(emotion, fid):
+            return True
+        # Emotions too large to cache still keep their prefetched opening frames
+        keyed = cached or (index < self.prefetch_frames and isinstance(frames, list))
+        shown = self.display_frame(frames[index], self.frame_key(emotion, index) if keyed else None)
+        self.on_screen = fid if shown else None
+        self.frame_shown()
+        return shown
+
+    def show_transition_frame(self, item):
+        """Display an item of a transition clip, see transitions.py"""
+        if item[0] == 'neutral':
+            self.neutral_index = item[1]
+            fid = self.content_id('neutral', item[1])
+        else:
+            fid = item[1]
+        if self.skip_unchanged('transition', fid):
+            return True
+        try:
+            frame = self.transitions.frame(item)
+        except Exception as e:
+            logging.error(f"Error rendering {item[0]} transition frame: {e}")
+            self.on_screen = None
+            return False
+        shown = self.display_frame(frame)
+        self.on_screen = fid if shown else None
+        self.frame_shown()
+        return shown
+
+    def frame_shown(self):
+        """Record the latency of the last command once its first frame is queued"""
+        command_time, self.command_time = self.command_time, None
+        if command_time is not None:
+            self.telemetry.observe('command_latency_seconds', "Time from a command to its first frame",
+                                   time.monotonic() - command_time)
+
+    def collect_metrics(self):
+        """Counters and gauges for the telemetry endpoint, see Telemetry.add_collector"""
+        timing = self.scheduler.stats()
+        metrics = [
+            ('frames_total', 'counter', "Frames shown, per emotion",
+             [({'emotion': e}, t['frames']) for e, t in timing.items()]),
+            ('frames_dropped_total', 'counter', "Frames skipped to catch up with their deadlines",
+             [({'emotion': e}, t['dropped']) for e, t in timing.items()]),
+            ('frames_late_total', 'counter', "Frames shown more than half a period late",
+             [({'emotion': e}, t['late']) for e, t in timing.items()]),
+            ('frames_unchanged_total', 'counter', "Frames not sent because the panel showed them already",
+             [({'emotion': e}, n) for e, n in self.skipped.items()]),
+            ('target_fps', 'gauge', "Frame rate each emotion is played at",
+             [({'emotion': e}, fps) for e, fps in self.emotion_speeds.items()]
+             + [({'emotion': 'transition'}, self.transition_speed)]),
+        ]
+        if hasattr(self, 'writer'):
+            stats = self.writer.stats()
+            panels = stats.items() if hasattr(self, 'group') else [('lcd', stats)]
+            metrics.append(('writer_dropped_total', 'counter', "Frames the display writer dropped",
+                            [({'panel': name}, s['dropped']) for name, s in panels]))
+        return metrics
+
+    def content_id(self, emotion, index):
+        """Id of the picture in a frame, shared by identical frames, or None if unknown"""
+        ids = self.frame_ids.get(emotion)
+        return ids[index] if ids and index < len(ids) else None
+
+    def skip_unchanged(self, emotion, fid):
+        """
+        Whether a frame is the one on the panel already, so it need not be
+        decoded or sent; the skip is counted under emotion.
+        """
+        if fid is None or fid != self.on_screen:
+            return False
+        self.skipped[emotion] = self.skipped.get(emotion, 0) + 1
+        return True
+
+    def skip_stats(self):
+        """Unchanged frames skipped and the bus time they would have taken, per emotion"""
+        panels = len(self.group.displays) if hasattr(self, 'group') else 1
+        frame_bytes = self.disp.width * self.disp.height * 2 + dirtyrect.WINDOW_OVERHEAD
+        frame_time = frame_bytes * 8 / self.disp.SPEED * panels
+        return {emotion: {'frames': count, 'bus_ms_saved': round(count * frame_time * 1000, 1)}
+                for emotion, count in self.skipped.items()}
+
+    def play_transition(self, clip):
+        """Play a transition clip at transition_speed, stopping when a command arrives"""
+        for index in self.scheduler.frames('transition', len(clip), self.transition_speed):
+            if not self.running or not self.command_queue.empty():
+                return
+            self.show_transition_frame(clip[index])
+
+    def play_frames(self, frames, emotion, is_transition=False, first=0):
         """
         Play frames for an emotion with specified timing on LCD.
         
         Args:
-            frames: List of frame paths to play
+            frames: List of frame paths, or a FramePack or DeltaPack, to play
             emotion: Name of the emotion being played
             is_transition: Whether this is a transition from neutral state
+            first: Index of the frame to start at
         """
         if not frames:
             logging.warning(f"No frames found for emotion: {emotion}")
+            if emotion in ['sleep', 'neutral'] and not is_transition:
+                self.wait_for_command()  # Nothing to loop, idle until told otherwise
             return
             
-        # Calculate delay based on emotion or transition speed
+        # Frame rate based on emotion or transition speed
         speed = self.transition_speed if is_transition else self.emotion_speeds[emotion]
-        delay = 1.0 / speed  # Convert fps to seconds
         
         # Determine if emotion should loop (only neutral and sleep loop)
         should_loop = emotion in ['sleep', 'neutral'] and not is_transition
         
-        while self.running:
-            for frame_path in frames:
-                if not self.running:
-                    return
-                
-                # Check for new commands during playback
-                if not self.command_queue.empty():
-                    return
-                
-                # Display frame on LCD
-                self.display_frame(frame_path)
-                time.sleep(delay)
-            
-            # For non-looping emotions, hold last frame briefly then exit
-            if not should_loop:
-                time.sleep(0.5)  # Hold last frame for 500ms
+        # The scheduler waits for each frame's deadline, skips frames when
+        # playback falls behind and stops when a command arrives
+        timing_key = 'transition' if is_transition else emotion
+        cached = self.cache_frames(emotion, frames)
+        self.prefetch_after(emotion)
+        for index in self.scheduler.frames(timing_key, len(frames), speed, loop=should_loop, first=first):
+            # Check for new commands during playback
+            if not self.running or not self.command_queue.empty():
                 return
             
-            # For looping emotions, check if we should continue
-            if not should_loop or not self.running or not self.command_queue.empty():
-                return
+            # Display frame on LCD
+            self.show_frame(emotion, frames, index, cached)
+        
+        # For non-looping emotions, hold last frame briefly then exit
+        if self.running and self.command_queue.empty():
+            self.wait_for_command(0.5)  # Hold last frame for 500ms
 
     def play_sleep_loop(self):
         """Handle sleep state with continuous animation"""
@@ -187,62 +682,149 @@ class RobotEmotionsLCD:
         self.current_state = 'neutral'
         while self.running and self.current_state == 'neutral':
             if not self.command_queue.empty():
-                command = self.command_queue.get().strip()
+                command = self.command_queue.get_nowait().strip()
                 if command:  # Ignore empty commands
-                    if command in ['angry', 'blink', 'blink2', 'dizzy', 'excited', 
-                                 'happy', 'happy2', 'happy3', 'sad']:
-                        # Play accelerated neutral transition
-                        self.play_emotion('neutral', is_transition=True)
+                    if command in EMOTIONS:
+                        # Frames still loading in the background are waited for
+                        self.wait_for_frames(command)
+                        # Its opening frames are decoded during the transition
+                        self.prefetcher.note_request(command)
+                        # Short clip from the neutral frame on screen
+                        self.play_transition(self.transitions.clip_in(command, self.neutral_index))
                         # Play requested emotion
                         self.play_emotion(command)
+                        # Back to neutral where the emotion leaves off
+                        clip, self.neutral_index = self.transitions.clip_out(command)
+                        self.play_transition(clip)
                         self.current_state = 'neutral'
                         continue
                     
                     elif command == 'sleep':
+                        self.wait_for_frames('sleep')
                         self.play_sleep_loop()
+                        self.neutral_index = 0
                         continue
                     
                     elif command == 'bootup3':
+                        self.wait_for_frames('bootup3')
                         self.play_emotion('bootup3')
+                        self.neutral_index = 0
                         self.current_state = 'neutral'
                         continue
                     
                     elif command in ['exit', 'quit']:
-                        self.running = False
+                        self.shutdown()
                         return
 
             # Continue neutral animation loop
-            self.play_frames(self.emotion_frames['neutral'], 'neutral')
+            self.play_frames(self.emotion_frames['neutral'], 'neutral', first=self.neutral_index)
             if not self.running or not self.command_queue.empty():
                 continue
 
     def command_listener(self):
         """Thread to handle user input commands"""
+        # A reader of its own: while blocked, a read of sys.stdin holds its lock, and the
+        # interpreter aborts if the player exits meanwhile (on a command server 'exit')
+        stdin = open(sys.stdin.fileno(), closefd=False)
         while self.running:
             try:
-                command = input().lower().strip()
-                self.command_queue.put(command)
+                line = stdin.readline()
+                if not line:
+                    raise EOFError
+                command = line.lower().strip()
+                self.accept_command(command)
                 if command in ['exit', 'quit']:
-                    self.running = False
                     break
             except (EOFError, KeyboardInterrupt):
-                self.running = False
+                self.shutdown()
                 break
 
-    def run(self):
-        """Initialize and run the robot emotions on LCD display"""
+    def setup(self):
+        """
+        Initialize the LCD and load the emotion frames; False if the LCD failed.
+
+        Only bootup is loaded before returning, and its first frame is put
+        on screen at once; the other emotions are loaded in the background
+        while bootup plays. wait_for_frames waits for them.
+        """
         # Initialize LCD
         if not self.initialize_lcd():
             logging.error("Failed to initialize LCD. Exiting.")
-            return
+            return False
             
-        # Load emotion frames
-        self.load_sorted_frames()
+        if self.profile_seconds:
+            self.profiler.start(self.profile_seconds)
+
+        # Load bootup and show its first frame
+        self.load_manifest()
+        # Bootup frames not in the frame store are hashed in the background
+        self.load_sorted_frames(['bootup'], hash_frames=False)
+        frames = self.emotion_frames['bootup']
+        if frames:
+            self.show_frame('bootup', frames, 0, self.cache_frames('bootup', frames))
+        self.prefetch_after(None)
+        if self.metrics_port:
+            try:
+                self.telemetry.serve(self.metrics_port)
+            except OSError as e:
+                logging.warning(f"Could not serve metrics on port {self.metrics_port}: {e}")
+        if self.metrics_file:
+            self.telemetry.write_every(self.metrics_file)
+
+        # Load the other emotions while bootup is on screen
+        loader = threading.Thread(target=self.load_assets, name="asset-loader")
+        loader.daemon = True
+        loader.start()
+        if frames and self.writer.flush(timeout=1.0):
+            logging.info(f"First frame on screen after {(time.monotonic() - STARTED) * 1000:.0f} ms")
+        return True
+
+    def cleanup(self):
+        """Stop the display pipeline, log its statistics and release the LCD"""
+        self.shutdown()
+        if self.command_server is not None:
+            self.command_server.close()
+        if hasattr(self, 'writer'):
+            self.writer.stop()
+        self.profiler.close()
+        self.scheduler.log_stats()
+        self.prefetcher.shutdown()
+        self.prefetcher.log_stats()
+        self.frame_cache.log_stats()
+        self.telemetry.log_summary()
+        self.telemetry.close()
+        if hasattr(self, 'disp'):
+            for emotion, stats in self.skip_stats().items():
+                logging.info(f"Unchanged frames skipped for {emotion}: {stats}")
+        self.close_frame_packs()
+        if hasattr(self, 'group'):
+            self.group.close()
+            logging.info("Displays cleared and exited")
+        elif hasattr(self, 'disp'):
+            try:
+                self.disp.clear()
+                self.disp.module_exit()
+                logging.info("Display cleared and exited")
+            except:
+                pass
+
+    def run(self):
+        """Initialize and run the robot emotions on LCD display"""
+        if not self.setup():
+            return
         
         # Start command listener in separate thread
         listener_thread = threading.Thread(target=self.command_listener)
         listener_thread.daemon = True
         listener_thread.start()
+        if self.command_socket:
+            try:
+                self.command_server = CommandServer(self.accept_command, self.command_socket,
+                                                    allow_remote=self.command_remote)
+                self.command_server.start()
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not take commands on {self.command_socket}: {e}")
+                self.command_server = None
 
         # Display available commands
         print("\nAvailable commands:")
@@ -255,30 +837,25 @@ class RobotEmotionsLCD:
         print("- sad: Show sad emotion")
         print("- sleep: Enter sleep mode")
         print("- bootup3: Show alternate boot animation")
+        print("- profile [seconds|stop]: Profile playback (see profiler.py)")
         print("- exit/quit: Exit program")
         print("\nWaiting for boot command...")
 
-        # Main program loop
+        # Main program loop, asleep until a command arrives
         try:
             while self.running:
-                if not self.command_queue.empty():
-                    command = self.command_queue.get().strip()
-                    if command == 'boot':
-                        self.play_emotion('bootup')
-                        self.play_neutral_loop()
-                    elif command in ['exit', 'quit']:
-                        break
+                command = self.next_command()
+                if command is None:
+                    continue
+                if command == 'boot':
+                    self.play_emotion('bootup')
+                    self.wait_for_frames('neutral')
+                    self.play_neutral_loop()
+                elif command in ['exit', 'quit']:
+                    break
         finally:
-            # Cleanup on exit
-            self.running = False
-            if hasattr(self, 'disp'):
-                try:
-                    self.disp.clear()
-                    self.disp.module_exit()
-                    logging.info("Display cleared and exited")
-                except:
-                    pass
-            sys.exit(0)
+            # Cleanup on exit; an exception still propagates and is reported
+            self.cleanup()
 
 if __name__ == "__main__":
     robot = RobotEmotionsLCD()
@@ -0,0 +1,164 @@
+#display with emotions/prefetch.py
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class Prefetcher:
+    """
+    Decodes the first frames of the emotions likely to play next into the
+    frame cache, on a small thread pool, while the current one plays.
+
+    The robot's next move is easy to guess: every emotion returns to
+    neutral, an idle robot is sent to sleep, and commands come from a small
+    fixed set that users tend to repeat. With the opening frames of those
+    already converted, the first frame after a command comes from memory
+    and the rest follow at the decode rate, instead of the command waiting
+    on disk I/O and a PNG decode.
+
+    PIL decoding and most of the RGB565 conversion release the GIL, so the
+    workers run alongside the player and the display writer.
+    """
+
+    def __init__(self, cache, load, frames=8, workers=2, recent=3, key=None):
+        """
+        Args:
+            cache: FrameCache the frames are put in
+            load: Called with a frame path from a worker thread, returns the
+                  converted frame; must be thread-safe
+            frames: Number of leading frames to prefetch per emotion
+            workers: Worker threads
+            recent: Number of recently requested emotions to keep warm
+            key: Called with (emotion, frame index), returns the frame's cache
+                 key; (emotion, frame index) itself by default
+        """
+        self.cache = cache
+        self.load = load
+        self.frames = frames
+        self.recent = deque(maxlen=recent)
+        self.key = key or (lambda emotion, index: (emotion, index))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._pending = {}  # key -> Future
+        self._lock = threading.Lock()
+
+        # Counters
+        self.prefetched = 0
+        self.cancelled = 0
+        self.joined = 0  # lookups that waited for a frame being prefetched
+
+    def note_request(self, emotion):
+        """Remember a requested emotion as a likely future one"""
+        if emotion in self.recent:
+            self.recent.remove(emotion)
+        self.recent.appendleft(emotion)
+
+    def candidates(self, current):
+        """
+        Emotions likely to follow the current one, most likely first.
+
+        Args:
+            current: Emotion playing now, or None before boot
+        """
+        if current is None:
+            return ['bootup']
+        if current != 'neutral':
+            return ['neutral']
+        return list(self.recent) + ['sleep']
+
+    def prefetch(self, emotions, frame_sets):
+        """
+        Queue the leading frames of emotions for decoding, in order.
+
+        Frames queued by an earlier call that have not started yet are
+        dropped, so the pool always works on the current guess.
+
+        Args:
+            emotions: Emotions to prefetch, most likely first
+            frame_sets: Mapping of emotion to its frame paths
+        """
+        wanted = []
+        for emotion in emotions:
+            paths = frame_sets.get(emotion)
+            if not paths or not isinstance(paths, list):
+                continue  # no frames, or a frame pack that needs no decoding
+            wanted.extend((self.key(emotion, i), self.load, path) for i, path in enumerate(paths[:self.frames]))
+
+        keys = set(key for key, _, _ in wanted)
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if key not in keys and future.cancel():
+                    del self._pending[key]
+                    self.cancelled += 1
+        for key, make, arg in wanted:
+            self.render(key, make, arg)
+
+    def render(self, key, make, *args):
+        """
+        Have a worker call make(*args) and cache the frame it returns under key.
+
+        Nothing is queued if the frame is cached or already queued, and
+        nothing is cached if make returns None.
+        """
+        with self._lock:
+            if key in self._pending or key in self.cache:
+                return
+            try:
+                self._pending[key] = self._executor.submit(self._load, key, make, args)
+            except RuntimeError:
+                pass  # shut down
+
+    def lookup(self, key):
+        """
+        Cached frame for key, waiting for it if it is being prefetched.
+
+        Returns:
+            The frame, or None when it is neither cached nor being prefetched
+        """
+        frame = self.cache.get(key)
+        if frame is not None:
+            return frame
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None:
+            return None
+        try:
+            frame = future.result()
+        except CancelledError:
+            return None
+        if frame is not None:
+            self.joined += 1
+        return frame
+
+    def _load(self, key, make, args):
+        try:
+            frame = make(*args)
+            if frame is not None:
+                self.cache.put(key, frame)
+                self.prefetched += 1
+            return frame
+        except Exception as e:
+            logging.warning(f"Could not prefetch frame {key}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def shutdown(self):
+        """Drop queued work and wait for the workers to finish"""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        """Counters as a dict"""
+        return {
+            'prefetched': self.prefetched,
+            'cancelled': self.cancelled,
+            'joined': self.joined,
+            'recent': list(self.recent),
+        }
+
+    def log_stats(self):
+        logging.info("Prefetcher: %s", self.stats())
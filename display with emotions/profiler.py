@@ -0,0 +1,272 @@
+#display with emotions/profiler.py
+"""
+On-demand CPU and memory profiling of the player, for stutters in the field.
+
+A capture runs cProfile around the player's play_frames and display_frame
+calls, and tracemalloc over the whole process, for a number of seconds,
+then writes its reports and stops; the robot keeps playing throughout.
+It is started by any of:
+
+    LCD_PROFILE=30 python new.py       # the first 30 seconds from boot
+    kill -USR1 <pid>                   # a capture of 10 seconds, or stop one early
+    profile / profile 30 / profile stop   # typed like an emotion command
+
+Nothing is hooked while no capture runs: the profiled methods are wrapped
+by instance attributes set when a capture starts and removed when it ends,
+so the player's own methods are called as usual the rest of the time.
+
+Each capture writes, to LCD_PROFILE_DIR (profiles/ next to the player by
+default):
+
+    profile-<time>.prof         cProfile data, for pstats or snakeviz
+    profile-<time>-cpu.txt      calls sorted by cumulative and own time
+    profile-<time>-memory.txt   allocation growth over the capture, by line
+"""
+import os
+import time
+import pstats
+import signal
+import cProfile
+import logging
+import functools
+import threading
+import tracemalloc
+
+PROFILED = ('play_frames', 'display_frame')
+SECONDS = 10  # length of a capture started by signal or command
+
+
+class _Thread:
+    """cProfile state of one thread in a capture"""
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.depth = 0  # profiled calls in progress on the thread
+        self.enabled = False
+        self.calls = 0
+
+
+class _Capture:
+    """One capture: per-thread profiles and the memory snapshot it started from"""
+
+    def __init__(self, seconds, memory):
+        self.seconds = seconds
+        self.started = time.time()
+        self.over = False
+        self.threads = {}  # thread ident -> _Thread
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.idle = threading.Event()  # set once no thread is profiling after the capture is over
+        self.memory = memory
+        self.own_tracing = False
+        self.snapshot = None
+        if memory:
+            self.own_tracing = not tracemalloc.is_tracing()
+            if self.own_tracing:
+                tracemalloc.start(5)
+            tracemalloc.reset_peak()
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def enter(self):
+        """Entering a profiled call on the current thread"""
+        ident = threading.get_ident()
+        state = self.threads.get(ident)
+        if state is None:
+            with self.lock:
+                state = self.threads.setdefault(ident, _Thread(threading.current_thread().name))
+        state.depth += 1
+        state.calls += 1
+        if state.depth == 1 and not self.over and not state.enabled:
+            try:
+                state.profile.enable()
+                state.enabled = True
+            except ValueError as e:  # another profiler is active
+                logging.debug(f"Not profiling {state.name}: {e}")
+        return state
+
+    def exit(self, state):
+        """Leaving a profiled call; the profile is stopped at the outermost call, or once the capture is over"""
+        state.depth -= 1
+        if state.enabled and (state.depth == 0 or self.over):
+            state.profile.disable()
+            state.enabled = False
+            if self.over:
+                self._check_idle()
+
+    def end(self):
+        self.over = True
+        self._check_idle()
+
+    def _check_idle(self):
+        with self.lock:
+            if not any(state.enabled for state in self.threads.values()):
+                self.idle.set()
+
+
+class Profiler:
+    """
+    Runs captures on a player object.
+
+    Args:
+        target: Object whose methods are profiled, the RobotEmotionsLCD
+        out_dir: Directory the reports are written to
+        methods: Names of the target's methods to profile
+        memory: Also trace allocations with tracemalloc
+    """
+
+    def __init__(self, target, out_dir, methods=PROFILED, memory=True):
+        self.target = target
+        self.out_dir = out_dir
+        self.methods = tuple(methods)
+        self.memory = memory
+        self._capture = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self._capture is not None
+
+    def start(self, seconds=SECONDS):
+        """
+        Start a capture of seconds, unless one is running.
+
+        Returns:
+            True if a capture was started
+        """
+        with self._lock:
+            if self._capture is not None:
+                logging.info("A profile capture is already running")
+                return False
+            capture = _Capture(seconds, self.memory)
+            for name in self.methods:
+                setattr(self.target, name, self._wrap(capture, getattr(self.target, name)))
+            self._capture = capture
+            self._thread = threading.Thread(target=self._run, args=(capture,), name="profiler")
+            self._thread.daemon = True
+            self._thread.start()
+        logging.info(f"Profiling {', '.join(self.methods)} for {seconds:g} s")
+        return True
+
+    def stop(self):
+        """End the running capture early; its reports are still written"""
+        capture = self._capture
+        if capture is not None:
+            capture.stop.set()
+
+    def close(self, timeout=5.0):
+        """End the running capture and wait for its reports"""
+        thread = self._thread
+        self.stop()
+        if thread is not None:
+            thread.join(timeout)
+
+    def on_signal(self, signum, frame):
+        """Signal handler: start a capture, or stop the one running"""
+        if self.active:
+            self.stop()
+        else:
+            # Not in the handler, which may have interrupted start() holding the lock
+            threading.Thread(target=self.start, name="profiler-start", daemon=True).start()
+
+    def install_signal(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """Start and stop captures on a signal (SIGUSR1); only from the main thread"""
+        if signum is not None:
+            signal.signal(signum, self.on_signal)
+
+    def command(self, command):
+        """
+        Act on a 'profile', 'profile <seconds>' or 'profile stop' command.
+
+        Returns:
+            True if command was a profile command, handled here
+        """
+        words = command.split()
+        if not words or words[0] != 'profile':
+            return False
+        if len(words) == 1:
+            self.start()
+        elif words[1] in ('stop', 'off'):
+            self.stop()
+        else:
+            try:
+                self.start(float(words[1]))
+            except ValueError:
+                logging.info(f"Usage: profile [seconds | stop], not {command!r}")
+        return True
+
+    def _wrap(self, capture, method):
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            state = capture.enter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                capture.exit(state)
+        return profiled
+
+    def _run(self, capture):
+        """Capture thread: wait out the capture, unhook the methods and write the reports"""
+        capture.stop.wait(capture.seconds)
+        snapshot = peak = None
+        if capture.memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if capture.own_tracing:
+                tracemalloc.stop()
+        capture.end()
+        # Threads inside a profiled call stop their profile at their next profiled call or return
+        if not capture.idle.wait(2.0):
+            logging.warning("A thread was still in a profiled call; its calls are left out of the report")
+        with self._lock:
+            for name in self.methods:
+                if self.target.__dict__.get(name) is not None:
+                    delattr(self.target, name)
+            self._capture = None
+        try:
+            self.write_reports(capture, snapshot, peak)
+        except OSError as e:
+            logging.warning(f"Could not write profile reports to {self.out_dir}: {e}")
+
+    def write_reports(self, capture, snapshot, peak):
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, 'profile-' + time.strftime('%Y%m%d-%H%M%S', time.localtime(capture.started)))
+        elapsed = time.time() - capture.started
+        written = []
+
+        with capture.lock:
+            threads = [state for state in capture.threads.values() if not state.enabled and state.calls]
+        if threads:
+            stats = None
+            for state in threads:
+                if stats is None:
+                    stats = pstats.Stats(state.profile)
+                else:
+                    stats.add(state.profile)
+            stats.dump_stats(base + '.prof')
+            with open(base + '-cpu.txt', 'w') as f:
+                f.write(f"{elapsed:.1f} s capture of {', '.join(self.methods)}; "
+                        + ', '.join(f"{state.name}: {state.calls} calls" for state in threads) + "\n")
+                stats.stream = f
+                stats.sort_stats('cumulative').print_stats(40)
+                stats.sort_stats('tottime').print_stats(25)
+            written += [base + '.prof', base + '-cpu.txt']
+
+        if snapshot is not None:
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            growth = snapshot.filter_traces(ignore).compare_to(capture.snapshot.filter_traces(ignore), 'lineno')
+            with open(base + '-memory.txt', 'w') as f:
+                f.write(f"{elapsed:.1f} s capture; traced peak {peak / 1024 / 1024:.1f} MiB\n\n")
+                f.write("Allocation growth by line:\n")
+                for stat in growth[:30]:
+                    f.write(f"{stat}\n")
+                f.write("\nLargest allocations at the end, by line:\n")
+                for stat in snapshot.filter_traces(ignore).statistics('lineno')[:20]:
+                    f.write(f"{stat}\n")
+            written.append(base + '-memory.txt')
+
+        if written:
+            logging.info(f"Profile reports: {', '.join(written)}")
+        else:
+            logging.info("Profile capture ended with nothing to report")
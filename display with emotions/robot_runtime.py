@@ -0,0 +1,346 @@
+#display with emotions/robot_runtime.py
+"""
+One asyncio runtime for the whole robot.
+
+new.py, Emo-main/Code/final.py and touch.py each own a blocking loop, so
+the face, the touch sensor and the arms could not run in one process.
+Here they are tasks on one event loop:
+
+    dispatch      takes commands from every source and starts animations
+    animation     the emotion being played; a new command cancels it at
+                  once, between two frames
+    gesture       servo moves that go with the emotion
+    touch         polls the capacitive touch sensor (touch.py's pin 17)
+    commands      stdin, read by a daemon thread and posted to the loop,
+                  and the command server (see command_server.py)
+
+Frame decoding and the hand-off to the display writer, servo writes and
+GPIO reads run in executors, so the loop never blocks on hardware and a
+command is acted on within one frame's worth of work.
+
+Run from the "display with emotions" directory:
+
+    python robot_runtime.py
+    LCD_BACKEND=sim python robot_runtime.py     # without the hardware
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from new import RobotEmotionsLCD, EMOTIONS
+from command_server import CommandServer
+
+# Wiring, as in Emo-main/Code/final.py
+TOUCH_PIN = 17
+SERVO_I2C_ADDRESS = 0x40
+SG90_SERVO1_CHANNEL = 0
+SG90_SERVO2_CHANNEL = 1
+MG90_SERVO_CHANNEL = 2
+
+# Servo moves: (angle per channel, seconds to hold) steps, back to REST after
+REST = {SG90_SERVO1_CHANNEL: 90, SG90_SERVO2_CHANNEL: 90, MG90_SERVO_CHANNEL: 90}
+GESTURES = {
+    'touch': [({SG90_SERVO1_CHANNEL: 0, SG90_SERVO2_CHANNEL: 180, MG90_SERVO_CHANNEL: 90}, 0.5)],
+    'happy': [({SG90_SERVO1_CHANNEL: 45, SG90_SERVO2_CHANNEL: 135}, 0.3),
+              ({SG90_SERVO1_CHANNEL: 135, SG90_SERVO2_CHANNEL: 45}, 0.3)] * 2,
+    'excited': [({SG90_SERVO1_CHANNEL: 0, SG90_SERVO2_CHANNEL: 180}, 0.2),
+                ({SG90_SERVO1_CHANNEL: 180, SG90_SERVO2_CHANNEL: 0}, 0.2)] * 3,
+    'angry': [({MG90_SERVO_CHANNEL: 60}, 0.2), ({MG90_SERVO_CHANNEL: 120}, 0.2)] * 3,
+    'dizzy': [({MG90_SERVO_CHANNEL: 45}, 0.4), ({MG90_SERVO_CHANNEL: 135}, 0.4)] * 3,
+    'sad': [({SG90_SERVO1_CHANNEL: 150, SG90_SERVO2_CHANNEL: 30, MG90_SERVO_CHANNEL: 80}, 1.0)],
+    'sleep': [({SG90_SERVO1_CHANNEL: 160, SG90_SERVO2_CHANNEL: 20}, 0.5)],
+}
+
+
+class ServoBank:
+    """
+    Servos on the PCA9685 driver, through adafruit_servokit.
+
+    Without the library or the I2C device (e.g. off the Pi) the servos are
+    disabled and moves are only logged.
+    """
+
+    def __init__(self, address=SERVO_I2C_ADDRESS, channels=16):
+        try:
+            from adafruit_servokit import ServoKit
+            self.kit = ServoKit(channels=channels, address=address)
+        except Exception as e:
+            logging.warning(f"Servos disabled: {e}")
+            self.kit = None
+
+    def set_angles(self, angles):
+        """Move servos, given as {channel: angle in degrees}"""
+        for channel, angle in angles.items():
+            if self.kit is None:
+                logging.debug(f"Servo {channel} -> {angle}")
+            else:
+                self.kit.servo[channel].angle = angle
+
+
+class RobotRuntime:
+    """
+    Face, commands, touch sensor and servos on one asyncio event loop.
+
+    The player (RobotEmotionsLCD) still owns the LCD, the frames, the frame
+    cache and the display writer; the runtime drives it in place of its
+    own blocking loops.
+    """
+
+    def __init__(self, player=None, servos=None, touch_pin=TOUCH_PIN, touch_command='happy',
+                 poll_interval=0.05, touch_debounce=0.5, read_stdin=True, boot=False,
+                 command_socket=None, command_remote=False):
+        """
+        Args:
+            player: RobotEmotionsLCD to drive, a new one by default
+            servos: ServoBank, opened when the runtime starts by default
+            touch_pin: GPIO pin of the touch sensor, or None for no sensor
+            touch_command: Emotion played when the sensor is touched
+            poll_interval: Seconds between touch sensor reads
+            touch_debounce: Seconds to ignore the sensor after a touch
+            read_stdin: Take commands from stdin; end of input exits
+            boot: Boot at once instead of waiting for the boot command
+            command_socket: UNIX socket path or localhost port to also take
+                            commands on, see command_server.py
+            command_remote: Allow command_socket to be a TCP address off loopback;
+                            its clients are not authenticated
+        """
+        self.player = player or RobotEmotionsLCD()
+        self.servos = servos
+        self.touch_pin = touch_pin
+        self.touch_command = touch_command
+        self.poll_interval = poll_interval
+        self.touch_debounce = touch_debounce
+        self.read_stdin = read_stdin
+        self.boot_at_start = boot
+        self.command_socket = command_socket
+        self.command_remote = command_remote
+        self.command_server = None
+
+        self.state = None  # None until booted, then the emotion or loop playing
+        self.loop = None
+        self.commands = None
+        self.animation = None
+        self.gesture = None
+        self.touches = 0
+
+    def post(self, command):
+        """Queue a command; safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self.commands.put_nowait, command)
+
+    async def run(self):
+        """Run until an exit command, end of input or SIGINT"""
+        self.loop = asyncio.get_running_loop()
+        self.commands = asyncio.Queue()
+        # One thread keeps frames in order; the other is for servos and GPIO
+        self.display_executor = ThreadPoolExecutor(1, thread_name_prefix="display")
+        self.io_executor = ThreadPoolExecutor(2, thread_name_prefix="robot-io")
+        try:
+            self.loop.add_signal_handler(signal.SIGINT, self.post, 'exit')
+        except (NotImplementedError, RuntimeError):
+            pass  # not the main thread, or no signal support
+
+        if not await self.loop.run_in_executor(self.display_executor, self.player.setup):
+            return
+        if self.servos is None:
+            self.servos = await self.loop.run_in_executor(self.io_executor, ServoBank)
+
+        tasks = [asyncio.ensure_future(self.watch_touch())]
+        if self.read_stdin:
+            reader = threading.Thread(target=self.stdin_reader, name="stdin-reader")
+            reader.daemon = True
+            reader.start()
+        if self.command_socket:
+            try:
+                self.command_server = CommandServer(self.post, self.command_socket,
+                                                    allow_remote=self.command_remote)
+                self.command_server.start()
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not take commands on {self.command_socket}: {e}")
+                self.command_server = None
+        if self.boot_at_start:
+            self.commands.put_nowait('boot')
+        else:
+            logging.info("Waiting for boot command...")
+        try:
+            await self.dispatch()
+        finally:
+            if self.command_server is not None:
+                self.command_server.close()
+            for task in tasks + [self.animation, self.gesture]:
+                if task is not None:
+                    task.cancel()
+            await asyncio.gather(*[t for t in tasks + [self.animation, self.gesture] if t is not None],
+                                 return_exceptions=True)
+            await self.loop.run_in_executor(self.io_executor, self.servos.set_angles, REST)
+            await self.loop.run_in_executor(self.display_executor, self.player.cleanup)
+            self.display_executor.shutdown()
+            self.io_executor.shutdown()
+
+    def stdin_reader(self):
+        """Thread posting stdin lines as commands"""
+        # Not sys.stdin, whose lock a blocked read holds when the runtime exits
+        for line in open(sys.stdin.fileno(), closefd=False):
+            self.post(line)
+        self.post('exit')
+
+    async def dispatch(self):
+        """Act on commands until exit"""
+        while True:
+            command = (await self.commands.get()).strip().lower()
+            if not command:
+                continue
+            if command in ('exit', 'quit'):
+                return
+            if self.player.profiler.command(command):
+                continue
+            self.player.command_time = time.monotonic()
+            self.handle(command)
+
+    def handle(self, command):
+        """Start what a command asks for, cancelling the animation playing"""
+        if self.state is None:
+            if command == 'boot':
+                self.state = 'bootup'
+                self.start(self.once('bootup'))
+            return
+        if self.state == 'sleep':
+            self.start(self.neutral())  # any input wakes from sleep
+        elif command in EMOTIONS:
+            self.player.prefetcher.note_request(command)
+            self.start(self.emotion(command), command)
+        elif command == 'touch':
+            self.start(self.emotion(self.touch_command), 'touch')
+        elif command == 'sleep':
+            self.start(self.sleep(), 'sleep')
+        elif command == 'bootup3':
+            self.start(self.once('bootup3'))
+        else:
+            logging.info(f"Unknown command: {command}")
+
+    def start(self, animation, gesture=None):
+        """Replace the animation playing, and the gesture if a new one goes with it"""
+        if self.animation is not None:
+            self.animation.cancel()
+        self.animation = asyncio.ensure_future(animation)
+        if gesture in GESTURES:
+            if self.gesture is not None:
+                self.gesture.cancel()
+            self.gesture = asyncio.ensure_future(self.move(GESTURES[gesture]))
+
+    # Animations
+
+    async def wait_for_frames(self, emotion):
+        """Wait until the player has loaded an emotion's frames, see RobotEmotionsLCD.setup"""
+        if emotion not in self.player.loaded_emotions:
+            await self.loop.run_in_executor(self.io_executor, self.player.wait_for_frames, emotion)
+
+    async def play(self, emotion, fps=None, loop=False, timing_key=None, first=0):
+        """Play an emotion's frames on their deadlines; cancel the task to stop"""
+        player = self.player
+        await self.wait_for_frames(emotion)
+        frames = player.emotion_frames.get(emotion)
+        if not frames:
+            logging.warning(f"No frames found for emotion: {emotion}")
+            return
+        cached = player.cache_frames(emotion, frames)
+        player.prefetch_after(emotion)
+        fps = fps or player.emotion_speeds[emotion]
+        async for index in player.scheduler.frames_async(timing_key or emotion, len(frames), fps, loop, first):
+            await self.loop.run_in_executor(self.display_executor, player.show_frame,
+                                            emotion, frames, index, cached)
+
+    async def play_transition(self, clip):
+        """Play a transition clip (see transitions.py) at the player's transition speed"""
+        player = self.player
+        async for index in player.scheduler.frames_async('transition', len(clip), player.transition_speed):
+            await self.loop.run_in_executor(self.display_executor, player.show_transition_frame, clip[index])
+
+    async def once(self, emotion):
+        """Play an emotion, hold its last frame, then go back to neutral"""
+        self.state = emotion
+        await self.play(emotion)
+        await asyncio.sleep(0.5)
+        await self.neutral()
+
+    async def emotion(self, emotion):
+        """Clip from neutral, the emotion, then a clip back to neutral"""
+        self.state = emotion
+        player = self.player
+        await self.wait_for_frames(emotion)
+        await self.wait_for_frames('neutral')
+        # Planned ahead by the prefetch workers, unless the emotion is new
+        clip = await self.loop.run_in_executor(self.display_executor, player.transitions.clip_in,
+                                               emotion, player.neutral_index)
+        await self.play_transition(clip)
+        await self.play(emotion)
+        await asyncio.sleep(0.5)
+        clip, player.neutral_index = player.transitions.clip_out(emotion)
+        await self.play_transition(clip)
+        await self.neutral(player.neutral_index)
+
+    async def neutral(self, first=0):
+        """Loop neutral from frame first"""
+        self.state = 'neutral'
+        await self.play('neutral', loop=True, first=first)
+
+    async def sleep(self):
+        self.state = 'sleep'
+        await self.play('sleep', loop=True)
+
+    # Servos and sensors
+
+    async def move(self, steps):
+        """Run servo steps, then return to rest; cancelling also returns to rest"""
+        try:
+            for angles, hold in steps:
+                await self.loop.run_in_executor(self.io_executor, self.servos.set_angles, angles)
+                await asyncio.sleep(hold)
+        finally:
+            await self.loop.run_in_executor(self.io_executor, self.servos.set_angles, REST)
+
+    async def watch_touch(self):
+        """Post a 'touch' command when the touch sensor goes high"""
+        if self.touch_pin is None:
+            return
+        gpio = self.player.disp.gpio
+        try:
+            pin = await self.loop.run_in_executor(self.io_executor, gpio.input, self.touch_pin, False)
+        except Exception as e:
+            logging.warning(f"Touch sensor disabled: {e}")
+            return
+        while True:
+            if await self.loop.run_in_executor(self.io_executor, lambda: pin.value):
+                self.touches += 1
+                logging.info(f"Touch detected, count: {self.touches}")
+                self.commands.put_nowait('touch')
+                await asyncio.sleep(self.touch_debounce)
+            await asyncio.sleep(self.poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the face, touch sensor and servos in one process")
+    parser.add_argument('--no-stdin', action='store_true', help="do not read commands from stdin")
+    parser.add_argument('--no-touch', action='store_true', help="do not watch the touch sensor")
+    parser.add_argument('--touch-command', default='happy', help="emotion played on touch")
+    parser.add_argument('--socket', default=os.environ.get('LCD_COMMAND_SOCKET'),
+                        help="also take commands on this UNIX socket path or localhost port")
+    parser.add_argument('--allow-remote', action='store_true',
+                        default=os.environ.get('LCD_COMMAND_REMOTE') == '1',
+                        help="let --socket be a TCP address off loopback; commands are not authenticated")
+    parser.add_argument('--boot', action='store_true', help="boot right away instead of waiting for 'boot'")
+    args = parser.parse_args()
+
+    runtime = RobotRuntime(touch_pin=None if args.no_touch else TOUCH_PIN,
+                           touch_command=args.touch_command, read_stdin=not args.no_stdin,
+                           boot=args.boot, command_socket=args.socket, command_remote=args.allow_remote)
+    asyncio.run(runtime.run())
+
+
+if __name__ == "__main__":
+    main()
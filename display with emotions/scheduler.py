@@ -0,0 +1,145 @@
+#display with emotions/scheduler.py
+import time
+import asyncio
+import logging
+
+
+class LatenessStats:
+    """Lateness of the frames of one emotion against their deadlines"""
+
+    def __init__(self):
+        self.frames = 0
+        self.dropped = 0
+        self.late = 0  # shown more than half a frame period after the deadline
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def record(self, lateness, period):
+        self.frames += 1
+        lateness = max(lateness, 0.0)
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if lateness > period / 2:
+            self.late += 1
+
+    def as_dict(self):
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'late': self.late,
+            'mean_late_ms': round(self.total_lateness / self.frames * 1000, 2) if self.frames else 0.0,
+            'max_late_ms': round(self.max_lateness * 1000, 2),
+        }
+
+
+class FrameScheduler:
+    """
+    Paces playback on absolute frame deadlines.
+
+    Frame i of an animation is due at start + i / fps on the monotonic
+    clock, so time spent decoding, converting and queueing a frame comes
+    out of the wait before the next one instead of adding to it, and
+    errors do not accumulate over a long loop. When playback falls a whole
+    frame or more behind, the frames whose deadlines have passed are
+    skipped, so an animation keeps its wall-clock duration on hardware
+    that cannot reach its frame rate. The last frame of an animation that
+    does not loop is never skipped.
+
+    Lateness and dropped frames are recorded per emotion, and the slack
+    left before each deadline in telemetry, when given.
+    """
+
+    def __init__(self, wait=None, clock=time.monotonic, telemetry=None):
+        """
+        Args:
+            wait: Called with the seconds until the next deadline; returns
+                  True to stop playback early. Sleeps by default.
+            clock: Monotonic clock in seconds
+            telemetry: Telemetry to record the slack in (see telemetry.py), or None
+        """
+        self.wait = wait or self._sleep
+        self.clock = clock
+        self.telemetry = telemetry
+        self.lateness = {}
+
+    @staticmethod
+    def _sleep(seconds):
+        time.sleep(seconds)
+        return False
+
+    def frames(self, emotion, count, fps, loop=False, first=0):
+        """
+        Yield the indices of the frames to show, each at its deadline.
+
+        The caller shows frame i as soon as it is yielded. The generator
+        then waits for the next deadline and stops when wait() returns True.
+
+        Args:
+            emotion: Name the lateness statistics are kept under
+            count: Number of frames in the animation
+            fps: Frames per second
+            loop: Start over after the last frame instead of stopping
+            first: Index to start at; count frames are shown from there,
+                   wrapping around to the first frame
+        """
+        for index, deadline in self.timeline(emotion, count, fps, loop, first):
+            yield index
+            remaining = deadline - self.clock()
+            self._slack(emotion, remaining)
+            if remaining > 0 and self.wait(remaining):
+                return
+
+    async def frames_async(self, emotion, count, fps, loop=False, first=0):
+        """
+        frames() for asyncio: waits for each deadline with asyncio.sleep.
+
+        Playback is stopped by cancelling the task iterating over it.
+        """
+        for index, deadline in self.timeline(emotion, count, fps, loop, first):
+            yield index
+            remaining = deadline - self.clock()
+            self._slack(emotion, remaining)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    def _slack(self, emotion, remaining):
+        if self.telemetry is not None:
+            self.telemetry.observe('frame_slack_seconds', "Time left before the next frame's deadline, 0 when late",
+                                   max(remaining, 0.0), emotion=emotion)
+
+    def timeline(self, emotion, count, fps, loop=False, first=0):
+        """
+        Yield (frame index, deadline of the next frame) pairs.
+
+        The caller shows the frame, then waits until the deadline before
+        asking for the next pair; frames that are already overdue by then
+        are skipped. Arguments as for frames().
+        """
+        if count <= 0 or fps <= 0:
+            return
+        stats = self.lateness.setdefault(emotion, LatenessStats())
+        period = 1.0 / fps
+        start = self.clock()
+        i = 0
+        while loop or i < count:
+            lateness = self.clock() - (start + i * period)
+            if lateness >= period:
+                # A frame or more behind: jump to the frame due now
+                due = i + int(lateness / period)
+                if not loop:
+                    due = min(due, count - 1)
+                if due > i:
+                    stats.dropped += due - i
+                    lateness -= (due - i) * period
+                    i = due
+            stats.record(lateness, period)
+            yield (first + i) % count, start + (i + 1) * period
+            i += 1
+
+    def stats(self):
+        """Lateness statistics per emotion as a dict"""
+        return {emotion: stats.as_dict() for emotion, stats in self.lateness.items()}
+
+    def log_stats(self):
+        for emotion, stats in self.stats().items():
+            logging.info(f"Frame timing for {emotion}: {stats}")
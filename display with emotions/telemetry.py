@@ -0,0 +1,234 @@
+#display with emotions/telemetry.py
+"""
+Frame timing telemetry for robots running unattended.
+
+The player records, per frame, how long decoding, RGB565 conversion and
+the SPI transfer took, how much time was left before the frame's deadline
+(slack; 0 when late), how many frames were waiting for the writer, and how
+long a command took to reach its first frame. Each goes into a histogram
+with fixed bucket bounds: recording is a dict lookup, a bisect and a
+locked increment, a few microseconds per frame in all.
+
+The histograms, and counters such as frames dropped per emotion, are
+served in the Prometheus text format on a localhost HTTP endpoint, written
+to a file periodically (for node_exporter's textfile collector), or both:
+
+    LCD_METRICS_PORT=9101 python new.py        # curl localhost:9101/metrics
+    LCD_METRICS_FILE=/var/lib/node_exporter/emo.prom python new.py
+"""
+import os
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket upper bounds: seconds from 50 us to 1.6 s, doubling; queued frames
+SECONDS = tuple(0.00005 * 2 ** i for i in range(16))
+FRAMES = (0, 1, 2, 3, 4, 6, 8)
+
+
+class Histogram:
+    """
+    Counts of observations per bucket, plus their sum.
+
+    Written from several threads at once (the prefetch workers, the player
+    and the display writer all decode or convert frames), so updates and
+    reads hold a lock; snapshot() gives counts and a sum that agree.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """(counts, sum) as of one moment"""
+        with self._lock:
+            return list(self.counts), self.sum
+
+    @property
+    def count(self):
+        return sum(self.snapshot()[0])
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, or None if empty"""
+        counts = self.snapshot()[0]
+        total = sum(counts)
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            seen += count
+            if seen >= q * total:
+                return bound
+        return float('inf')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def _number(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Telemetry:
+    """
+    Histograms and counters by name and labels, rendered as Prometheus text.
+
+    Args:
+        prefix: Prepended to every metric name
+    """
+
+    def __init__(self, prefix='emo_'):
+        self.prefix = prefix
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._help = {}  # name -> help text
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._writer = None
+        self._stop = threading.Event()
+
+    def histogram(self, name, help, bounds=SECONDS, **labels):
+        """The histogram of a name and label values, created on first use"""
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram(bounds))
+                self._help.setdefault(name, help)
+        return hist
+
+    def observe(self, name, help, value, bounds=SECONDS, **labels):
+        """Record one value; see histogram()"""
+        self.histogram(name, help, bounds, **labels).observe(value)
+
+    def add_collector(self, collect):
+        """
+        Have collect() called on every render.
+
+        It returns (name, type, help, [(labels dict, value), ...]) tuples,
+        type being 'counter' or 'gauge'.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        last = None
+        for (name, labels), hist in histograms:
+            full = self.prefix + name
+            if name != last:
+                lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                last = name
+            counts, total = hist.snapshot()
+            cumulative = 0
+            for bound, count in zip(hist.bounds + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{full}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{full}_sum{_labels(labels)} {total!r}")
+            lines.append(f"{full}_count{_labels(labels)} {cumulative}")
+        for collect in self._collectors:
+            try:
+                metrics = collect()
+            except Exception as e:
+                logging.warning(f"Telemetry collector failed: {e}")
+                continue
+            for name, kind, help, samples in metrics:
+                full = self.prefix + name
+                lines.append(f"# HELP {full} {help}")
+                lines.append(f"# TYPE {full} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{full}{_labels(sorted(labels.items()))} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """{name: {labels: (count, p50, p99)}} of the histograms, for logs"""
+        result = {}
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for (name, labels), hist in histograms:
+            label = ','.join(str(value) for _, value in labels) or '-'
+            result.setdefault(name, {})[label] = (hist.count, hist.quantile(0.5), hist.quantile(0.99))
+        return result
+
+    def log_summary(self):
+        for name, series in self.summary().items():
+            logging.info(f"Telemetry {name} (count, p50, p99 bucket): {series}")
+
+    # Exposure
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve the metrics on http://host:port/metrics from a daemon thread"""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = telemetry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # one line per scrape would flood the log
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="metrics-http")
+        thread.daemon = True
+        thread.start()
+        logging.info(f"Metrics on http://{host}:{self._server.server_address[1]}/metrics")
+
+    def write(self, path):
+        """Write the metrics to path, through a temporary file"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def write_every(self, path, interval=10.0):
+        """Write the metrics to path every interval seconds from a daemon thread, and on close()"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logging.warning(f"Could not write metrics to {path}: {e}")
+
+        self._path = path
+        self._writer = threading.Thread(target=run, name="metrics-file")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def close(self):
+        """Stop serving and writing; the metrics file gets a last update"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._writer.join(1.0)
+            self._writer = None
+            try:
+                self.write(self._path)
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {self._path}: {e}")
@@ -4,7 +4,6 @@ import os
 import sys
 import time
 import logging
-import spidev as SPI
 sys.path.append("..")
 from lib import LCD_2inch
 from PIL import Image
@@ -21,6 +20,7 @@ try:
     # Initialize the LCD display
     disp = LCD_2inch.LCD_2inch()
     disp.Init()
+    disp.set_orientation(rotation=180)  # Rotated by the LCD controller
     disp.clear()
     disp.bl_DutyCycle(50)  # Set backlight brightness
 
@@ -28,9 +28,6 @@ try:
     image_path = '/home/prok/Downloads/project/Phase-I-main/Emo-main/Code/emotions/happy/frame24.png'  # Path to the image file
     image = Image.open(image_path)
 
-    # Rotate the image if necessary (180 degrees)
-    image = image.rotate(180)
-
     # Display the image on the LCD
     disp.ShowImage(image)
     logging.info("Image displayed successfully")
@@ -0,0 +1,203 @@
+#display with emotions/transitions.py
+"""
+Short transition clips between the neutral loop and the other emotions.
+
+The player used to replay all of neutral at 60 fps before every emotion
+so the face would be back at the pose the emotion starts from, a second
+of delay on every command. A clip gets there in a few frames instead:
+
+    into an emotion    from the neutral frame on screen, a handful of
+                       neutral frames, evenly picked, up to the neutral
+                       frame closest to the emotion's first frame (its
+                       entry); then, unless that frame matches, a
+                       crossfade to the emotion's first frame
+    back to neutral    a crossfade from the emotion's last frame to the
+                       closest neutral frame (its exit) unless they
+                       match; neutral resumes from there
+
+Entry and exit frames are found once per emotion, on thumbnails, by the
+prefetch workers at boot (plan_ahead), so no command waits for them.
+Crossfades depend only on the emotion, so they are rendered ahead by the
+prefetch workers into the frame cache and played from memory. An emotion
+without frames gets empty clips. Frames are blended
+in RGB565 with NumPy, a whole frame at a time.
+"""
+import logging
+import threading
+
+import numpy as np
+
+
+def unpack_rgb565(pix, step=1):
+    """(h, w, 3) int16 red, green and blue channel values of an (h, w, 2) big-endian RGB565 frame"""
+    words = pix[::step, ::step].view('>u2')[..., 0].astype(np.int16)
+    return np.stack([words >> 11 & 0x1F, words >> 5 & 0x3F, words & 0x1F], axis=-1)
+
+
+def crossfade(a, b, t):
+    """Blend two (h, w, 2) RGB565 frames: a at t=0, b at t=1"""
+    channels = unpack_rgb565(a) * (1.0 - t) + unpack_rgb565(b) * t
+    channels = np.rint(channels).astype(np.uint16)
+    out = np.empty(a.shape, dtype=np.uint8)
+    out.view('>u2')[..., 0] = channels[..., 0] << 11 | channels[..., 1] << 5 | channels[..., 2]
+    return out
+
+
+class Transitions:
+    """
+    Plans and renders transition clips for the player.
+
+    A clip is a list of items: ('neutral', index) for a neutral frame, or
+    ('fade', cache key, source, target, t) for a crossfade frame;
+    frame(item) gives the RGB565 frame of either.
+    """
+
+    def __init__(self, player, path_steps=6, fade_steps=4, match=2.0, thumb_step=4):
+        """
+        Args:
+            player: RobotEmotionsLCD whose frames, frame cache and
+                    prefetcher are used
+            path_steps: Most neutral frames played on the way to the entry frame
+            fade_steps: Frames in a crossfade
+            match: Mean channel difference (on 5 and 6 bit channels) under
+                   which two frames count as the same pose
+            thumb_step: Pixel stride of the thumbnails the frames are compared on
+        """
+        self.player = player
+        self.path_steps = path_steps
+        self.fade_steps = fade_steps
+        self.match = match
+        self.thumb_step = thumb_step
+        self._plans = {}
+        self._neutral_thumbs = None
+        self._lock = threading.Lock()
+
+    def _thumb(self, emotion, index):
+        """Thumbnail of a frame, or None if the frame could not be loaded"""
+        try:
+            return unpack_rgb565(self.player.frame_pixels(emotion, index), self.thumb_step)
+        except Exception as e:
+            logging.warning(f"Could not load {emotion} frame {index} for transitions: {e}")
+            return None
+
+    def _closest(self, thumb):
+        """
+        (index, matches) of the neutral frame closest to a thumbnail. A frame
+        that failed to load goes straight to neutral frame 0, with no crossfade.
+        """
+        if thumb is None:
+            return 0, True
+        indices, thumbs = self._neutral_thumbs
+        distance = np.abs(thumbs - thumb).mean(axis=(1, 2, 3))
+        best = int(distance.argmin())
+        return int(indices[best]), bool(distance[best] <= self.match)
+
+    def plan(self, emotion):
+        """
+        Where an emotion joins and leaves the neutral loop.
+
+        Returns:
+            (entry index, entry matches, exit index, exit matches), or None
+            if the emotion or neutral has no frames
+        """
+        with self._lock:
+            plan = self._plans.get(emotion)
+            if plan is not None:
+                return plan
+            frames = self.player.emotion_frames.get(emotion)
+            neutral = self.player.emotion_frames['neutral']
+            if not frames or not neutral:
+                return None
+            if self._neutral_thumbs is None:
+                thumbs = [self._thumb('neutral', i) for i in range(len(neutral))]
+                loaded = [i for i, thumb in enumerate(thumbs) if thumb is not None]
+                self._neutral_thumbs = (np.array(loaded), np.stack([thumbs[i] for i in loaded]) if loaded else None)
+            if self._neutral_thumbs[1] is None:
+                return None
+            plan = (self._closest(self._thumb(emotion, 0))
+                    + self._closest(self._thumb(emotion, len(frames) - 1)))
+            self._plans[emotion] = plan
+            return plan
+
+    def plan_ahead(self, emotions):
+        """Have the prefetch workers plan emotions, so commands find their plans ready"""
+        for emotion in emotions:
+            self.player.prefetcher.render(('plan', emotion), self._plan_only, emotion)
+
+    def _plan_only(self, emotion):
+        self.plan(emotion)  # nothing to cache
+
+    def forget(self, emotion):
+        """Drop the plan of an emotion whose frames changed"""
+        with self._lock:
+            self._plans.pop(emotion, None)
+            if emotion == 'neutral':
+                self._plans.clear()
+                self._neutral_thumbs = None
+
+    def _fade_items(self, source, target):
+        """Crossfade items from (emotion, index) source to target, both ends excluded"""
+        player = self.player
+        ends = (player.frame_key(*source), player.frame_key(*target))
+        return [('fade', ('fade',) + ends + (step, self.fade_steps), source, target,
+                 step / (self.fade_steps + 1))
+                for step in range(1, self.fade_steps + 1)]
+
+    def clip_in(self, emotion, neutral_index):
+        """Clip from neutral frame neutral_index to the first frame of emotion"""
+        plan = self.plan(emotion)
+        if plan is None:
+            return []
+        entry, matches, _, _ = plan
+        count = len(self.player.emotion_frames['neutral'])
+        distance = (entry - neutral_index) % count
+        # Every neutral frame on the way, or path_steps of them evenly spread
+        steps = min(distance, self.path_steps)
+        path = [(neutral_index + round(distance * (i + 1) / steps)) % count for i in range(steps)]
+        clip = [('neutral', index) for index in path]
+        if not matches:
+            clip += self._fade_items(('neutral', entry), (emotion, 0))
+        return clip
+
+    def clip_out(self, emotion):
+        """
+        Clip from the last frame of emotion back to neutral.
+
+        Returns:
+            (clip, neutral index to resume the loop at)
+        """
+        plan = self.plan(emotion)
+        if plan is None:
+            return [], 0
+        _, _, resume, matches = plan
+        last = len(self.player.emotion_frames[emotion]) - 1
+        clip = [] if matches else self._fade_items((emotion, last), ('neutral', resume))
+        return clip, resume
+
+    def frame(self, item):
+        """RGB565 frame of a clip item"""
+        if item[0] == 'neutral':
+            return self.player.frame_pixels('neutral', item[1])
+        _, key, source, target, t = item
+        player = self.player
+        frame = player.prefetcher.lookup(key)
+        if frame is None:
+            frame = self._render(source, target, t)
+            player.frame_cache.put(key, frame)
+        return frame
+
+    def _render(self, source, target, t):
+        return crossfade(self.player.frame_pixels(*source), self.player.frame_pixels(*target), t)
+
+    def prepare(self, emotion):
+        """Have the prefetch workers plan the emotion and render its crossfades"""
+        self.player.prefetcher.render(('transitions', emotion), self._prepare, emotion)
+
+    def _prepare(self, emotion):
+        plan = self.plan(emotion)
+        if plan is None:
+            return
+        entry = plan[0]
+        for item in self.clip_in(emotion, entry) + self.clip_out(emotion)[0]:
+            if item[0] == 'fade':
+                self.player.prefetcher.render(item[1], self._render, *item[2:])